@@ -0,0 +1,231 @@
+# Fabric notebook source
+
+# METADATA ********************
+
+# META {
+# META   "kernel_info": {
+# META     "name": "jupyter",
+# META     "jupyter_kernel_name": "python3.11"
+# META   }
+# META }
+
+# MARKDOWN ********************
+
+# # Bulk Workspace Policy + Principal Applier
+# 
+# Applies a network communication policy baseline and a set of role assignments (users, groups, service principals) to many existing workspaces.
+# 
+# **How it works:**
+# 1. Read the current policy and role assignments of every target workspace concurrently
+# 2. Diff them against the baseline
+# 3. Issue only the writes that are needed (nothing is written when `varDryRun = True`)
+# 4. Print a throughput report
+# 
+# API calls therefore scale with the number of changes, not with the number of workspaces x settings.
+
+# MARKDOWN ********************
+
+# ## SET VARIABLES
+
+# PARAMETERS CELL ********************
+
+varTargetWorkspaceIds = [] #explicit workspace ids.  empty => every workspace matching the filters below
+varTargetNameFilter = "" #regex on the workspace name, e.g. "^Live"
+varTargetCapacityId = "" #only workspaces on this capacity
+varInbound = "Allow" #Allow or Deny
+varOutbound = "Allow" #Allow or Deny
+varPrincipals = [
+    {"id": "895e0a62-489f-444a-9b36-322fb8a7f795", "type": "User", "role": "Admin"}, #type: User | Group | ServicePrincipal | ServicePrincipalProfile
+]
+varDryRun = True #True => only report the diff, write nothing
+varMaxWorkers = 16 #concurrent API calls
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "jupyter_python"
+# META }
+
+# CELL ********************
+
+import re, time, threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import sempy.fabric as fabric
+
+client = fabric.FabricRestClient()
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "jupyter_python"
+# META }
+
+# MARKDOWN ********************
+
+# ## Helpers
+
+# CELL ********************
+
+class CountingClient:
+    """
+    Thin wrapper around FabricRestClient that counts reads / writes for the throughput report
+    and backs off when the API throttles (429).
+    """
+
+    def __init__(self, client, retries: int = 5):
+        self.client = client
+        self.retries = retries
+        self.calls = {"read": 0, "write": 0, "throttled": 0}
+        self._lock = threading.Lock()
+
+    def _call(self, kind: str, method: str, path: str, **kwargs):
+        for attempt in range(self.retries + 1):
+            with self._lock:
+                self.calls[kind] += 1
+            r = getattr(self.client, method)(path, **kwargs)
+            if r.status_code != 429 or attempt == self.retries:
+                r.raise_for_status()
+                return r
+            with self._lock:
+                self.calls["throttled"] += 1
+            time.sleep(float(r.headers.get("Retry-After", 2 ** attempt)))
+
+    def get(self, path, **kwargs):
+        return self._call("read", "get", path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self._call("write", "put", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self._call("write", "post", path, **kwargs)
+
+    def patch(self, path, **kwargs):
+        return self._call("write", "patch", path, **kwargs)
+
+
+def target_workspaces(ids: list, name_filter: str, capacity_id: str) -> pd.DataFrame:
+    workspaces = fabric.list_workspaces()
+    if ids:
+        return workspaces[workspaces["Id"].isin(ids)]
+    if name_filter:
+        workspaces = workspaces[workspaces["Name"].str.contains(name_filter, flags=re.IGNORECASE, regex=True)]
+    if capacity_id:
+        workspaces = workspaces[workspaces["Capacity Id"].str.lower() == capacity_id.lower()]
+    return workspaces
+
+
+def read_state(api: CountingClient, workspace_id: str) -> dict:
+    """
+    Current communication policy and role assignments of one workspace (follows continuation pages).
+    """
+    policy = api.get(f"v1/workspaces/{workspace_id}/networking/communicationPolicy").json()
+    assignments, path = [], f"v1/workspaces/{workspace_id}/roleAssignments"
+    while path:
+        page = api.get(path).json()
+        assignments += page.get("value", [])
+        token = page.get("continuationToken")
+        path = f"v1/workspaces/{workspace_id}/roleAssignments?continuationToken={token}" if token else None
+    return {"policy": policy, "assignments": assignments}
+
+
+def diff_state(workspace_id: str, state: dict, inbound: str, outbound: str, principals: list) -> list:
+    """
+    Writes needed to bring one workspace to the baseline, as (action, path, method, body) tuples.
+    """
+    changes = []
+    policy = state["policy"]
+    current = (
+        policy.get("inbound", {}).get("publicAccessRules", {}).get("defaultAction"),
+        policy.get("outbound", {}).get("publicAccessRules", {}).get("defaultAction"),
+    )
+    if current != (inbound, outbound):
+        desired = dict(policy)
+        desired.setdefault("inbound", {}).setdefault("publicAccessRules", {})["defaultAction"] = inbound
+        desired.setdefault("outbound", {}).setdefault("publicAccessRules", {})["defaultAction"] = outbound
+        changes.append((f"policy {current[0]}/{current[1]} -> {inbound}/{outbound}",
+                        f"v1/workspaces/{workspace_id}/networking/communicationPolicy", "put", desired))
+
+    existing = {a["principal"]["id"]: a for a in state["assignments"]}
+    for p in principals:
+        a = existing.get(p["id"])
+        if a is None:
+            changes.append((f"add {p['type']} {p['id']} as {p['role']}",
+                            f"v1/workspaces/{workspace_id}/roleAssignments", "post",
+                            {"principal": {"id": p["id"], "type": p["type"]}, "role": p["role"]}))
+        elif a["role"] != p["role"]:
+            changes.append((f"change {p['type']} {p['id']} {a['role']} -> {p['role']}",
+                            f"v1/workspaces/{workspace_id}/roleAssignments/{a['id']}", "patch", {"role": p["role"]}))
+    return changes
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "jupyter_python"
+# META }
+
+# MARKDOWN ********************
+
+# ## Read, diff and apply
+
+# CELL ********************
+
+def apply_baseline(workspaces: pd.DataFrame, inbound: str, outbound: str, principals: list,
+                   dry_run: bool = True, max_workers: int = 16) -> pd.DataFrame:
+    api = CountingClient(client)
+    start = time.time()
+
+    def plan(ws):
+        try:
+            return ws, diff_state(ws["Id"], read_state(api, ws["Id"]), inbound, outbound, principals), None
+        except Exception as e:
+            return ws, [], str(e)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        plans = list(pool.map(plan, workspaces.to_dict("records")))
+    read_seconds = time.time() - start
+
+    def write(change):
+        ws, (action, path, method, body) = change
+        if dry_run:
+            return ws, action, "planned", None
+        try:
+            getattr(api, method)(path, json=body)
+            return ws, action, "applied", None
+        except Exception as e:
+            return ws, action, "error", str(e)
+
+    pending = [(ws, c) for ws, changes, _ in plans for c in changes]
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        outcomes = list(pool.map(write, pending))
+    elapsed = time.time() - start
+
+    rows = [{"Workspace": ws["Name"], "WorkspaceId": ws["Id"], "Change": "read state", "Status": "error", "Error": err}
+            for ws, _, err in plans if err]
+    rows += [{"Workspace": ws["Name"], "WorkspaceId": ws["Id"], "Change": action, "Status": status, "Error": err}
+             for ws, action, status, err in outcomes]
+
+    calls = api.calls["read"] + api.calls["write"]
+    print(f"📊 {len(workspaces)} workspaces | {len(pending)} change(s) {'planned' if dry_run else 'applied'} | "
+          f"{sum(1 for _, c, err in plans if not c and not err)} already compliant")
+    print(f"   API calls: {api.calls['read']} reads, {api.calls['write']} writes, {api.calls['throttled']} throttled")
+    print(f"   Read phase {read_seconds:.1f}s | total {elapsed:.1f}s | {calls / elapsed if elapsed else 0:.1f} calls/s | "
+          f"{len(workspaces) / elapsed if elapsed else 0:.1f} workspaces/s")
+    return pd.DataFrame(rows, columns=["Workspace", "WorkspaceId", "Change", "Status", "Error"])
+
+
+workspaces = target_workspaces(varTargetWorkspaceIds, varTargetNameFilter, varTargetCapacityId)
+print(f"🎯 {len(workspaces)} target workspace(s)")
+changes = apply_baseline(workspaces, varInbound, varOutbound, varPrincipals, dry_run=varDryRun, max_workers=varMaxWorkers)
+display(changes)
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "jupyter_python"
+# META }
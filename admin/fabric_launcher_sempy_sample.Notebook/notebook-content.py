@@ -21,7 +21,7 @@
 # 1. Install/Import libraries
 # 2. Set your workspace + repo parameters
 # 3. (Optional) Deploy items using Fabric Launcher
-# 4. Discover semantic models and run a simple DAX query
+# 4. Validate the deployment with concurrent DAX / SQL smoke checks
 # 
 # > Notes: Library names/APIs can vary by version/preview. Adjust imports based on the package versions available in your Fabric tenant.
 
@@ -33,11 +33,33 @@
 
 # CELL ********************
 
-%pip install semantic-link -q
-#%pip install -U sempy -q #this is already installed by default on fabric compute
-%pip install -U fabric-launcher -q
-
-notebookutils.session.restartPython()
+# Only install (and restart Python) when a library is missing or not at the pinned version.
+# Pre-built wheels in WHEELHOUSE are used instead of PyPI when the folder exists.
+from importlib.metadata import version, PackageNotFoundError
+import os
+
+WHEELHOUSE = ".lakehouse/default/Files/wheelhouse"
+REQUIRED = {"semantic-link": None, "fabric-launcher": "0.4.1"} #sempy is already installed by default on fabric compute
+
+def missing_requirements(required: dict) -> list:
+    missing = []
+    for package, pinned in required.items():
+        try:
+            installed = version(package)
+        except PackageNotFoundError:
+            installed = None
+        if installed is None or (pinned and installed != pinned):
+            missing.append(f"{package}=={pinned}" if pinned else package)
+    return missing
+
+missing = missing_requirements(REQUIRED)
+if missing:
+    source = f"--no-index --find-links {WHEELHOUSE}" if os.path.isdir(WHEELHOUSE) else ""
+    print(f"📦 Installing {', '.join(missing)} {source}")
+    get_ipython().run_line_magic("pip", f"install -q {source} {' '.join(missing)}")
+    notebookutils.session.restartPython()
+else:
+    print("✅ Required libraries already installed")
 
 # METADATA ********************
 
@@ -72,6 +94,18 @@ varBranch="main"
 varAdminID = "895e0a62-489f-444a-9b36-322fb8a7f795"
 varFolder ="fabric_items" #the folder in the repo that contains your fabric artifacts to be deployed
 capacityID = "1db1d7e7-c9d2-4876-ab5c-2681738e0d88" #the capacity to assign the workspace to.  use the cell 2 down from here to list capacities if you do not know the id
+varCommit = "" #pin a commit SHA to deploy.  leave blank to resolve the current head of varBranch
+varRepoCacheRoot = ".lakehouse/default/Files/repo_cache" #local or lakehouse Files folder holding one repo snapshot per commit
+varLocalRepoPath = "" #deploy from an already extracted repo on disk instead of GitHub (skips the cache)
+varOffline = False #True => never call GitHub, deploy from varCommit or the newest cached snapshot
+varParallelDeploy = True #deploy items level by level from their dependency graph.  False => single launcher deployment
+varDeployDryRun = False #True => only print the dependency graph and critical path, deploy nothing
+varDeployWorkers = 8 #max items deployed at the same time within one level
+varParametersFile = "parameters.dev.yml" #source -> target id rebinding rules (repo root).  blank => deploy items unchanged
+varValidateBeforeDeploy = True #parse and cross-check every item offline and stop before deploying if anything is broken
+varValidationTimeout = 120 #seconds the whole post-deployment validation suite may take
+varInventoryTables = "" #abfss path of the Diagnostic_Lakehouse Tables folder.  set => read capacities from the cached inventory (OneLake_Logging_Setup) instead of calling the API
+varSmokeNotebooks = [] #notebooks to run once as a post-deployment check, e.g. ["1-ingest-data"].  empty => no notebook is run
 
 # METADATA ********************
 
@@ -118,7 +152,12 @@ except Exception as e:
 
 # CELL ********************
 
-capacities = fabric.list_capacities()
+if varInventoryTables:
+    from deltalake import DeltaTable
+    storage_options = {"bearer_token": notebookutils.credentials.getToken("storage"), "use_fabric_endpoint": "true"}
+    capacities = DeltaTable(f"{varInventoryTables}/inv_capacity", storage_options=storage_options).to_pandas()
+else:
+    capacities = fabric.list_capacities()
 capacities
 
 # METADATA ********************
@@ -213,6 +252,625 @@ result
 
 # MARKDOWN ********************
 
+# ## Resolve the repo snapshot from the local cache
+# The repo is downloaded once per commit into `varRepoCacheRoot/<owner>/<repo>/<commit>` and every later deployment of the same commit reuses it.
+# Set `varOffline = True` to deploy from a pre-seeded cache without calling GitHub, or `varLocalRepoPath` to deploy from any extracted copy of the repo.
+
+# CELL ********************
+
+import hashlib, json, shutil
+from datetime import datetime
+from pathlib import Path
+
+import requests
+from fabric_launcher import GitHubDownloader
+
+SNAPSHOT_MARKER = ".snapshot.json"
+
+def resolve_commit(repo_owner: str, repo_name: str, ref: str, github_token: str = None) -> str:
+    """
+    Resolve a branch or tag to the commit SHA it points at (one small GitHub call, no download).
+    """
+    headers = {"Accept": "application/vnd.github.sha"}
+    if github_token:
+        headers["Authorization"] = f"token {github_token}"
+    r = requests.get(f"https://api.github.com/repos/{repo_owner}/{repo_name}/commits/{ref}", headers=headers, timeout=30)
+    r.raise_for_status()
+    return r.text.strip()
+
+def latest_cached_commit(cache_root: str, repo_owner: str, repo_name: str):
+    """
+    Newest complete snapshot in the cache, or None when nothing has been cached yet.
+    """
+    repo_dir = Path(cache_root) / repo_owner / repo_name
+    markers = list(repo_dir.glob(f"*/{SNAPSHOT_MARKER}")) if repo_dir.exists() else []
+    if not markers:
+        return None
+    return max(markers, key=lambda m: m.stat().st_mtime).parent.name
+
+def ensure_snapshot(cache_root: str, repo_owner: str, repo_name: str, commit: str, offline: bool = False, github_token: str = None) -> Path:
+    """
+    Return the cached snapshot for a commit, downloading it first on a cache miss.
+    The snapshot is extracted to a .partial folder and only renamed into place once it is
+    complete, so an interrupted download is never mistaken for a cache hit.
+    """
+    snapshot = Path(cache_root) / repo_owner / repo_name / commit
+    if (snapshot / SNAPSHOT_MARKER).exists():
+        print(f"♻️ Cache hit: {repo_owner}/{repo_name}@{commit[:12]} -> {snapshot}")
+        return snapshot
+    if offline:
+        raise FileNotFoundError(f"Offline mode and no cached snapshot for {repo_owner}/{repo_name}@{commit} under {cache_root}")
+
+    print(f"📥 Cache miss: downloading {repo_owner}/{repo_name}@{commit[:12]}")
+    partial = snapshot.with_name(f"{commit}.partial")
+    if partial.exists():  # left over from an interrupted run
+        shutil.rmtree(partial)
+    GitHubDownloader(repo_owner=repo_owner, repo_name=repo_name, branch=commit, github_token=github_token) \
+        .download_and_extract_folder(extract_to=str(partial))
+
+    # Content manifest of the snapshot (sha256 per file), stored with the snapshot itself
+    files = {
+        str(f.relative_to(partial)): hashlib.sha256(f.read_bytes()).hexdigest()
+        for f in sorted(partial.rglob("*")) if f.is_file()
+    }
+    manifest = {
+        "repo": f"{repo_owner}/{repo_name}",
+        "commit": commit,
+        "cachedAtUtc": f"{datetime.utcnow().isoformat()}Z",
+        "files": files,
+    }
+    (partial / SNAPSHOT_MARKER).write_text(json.dumps(manifest, indent=2))
+
+    if snapshot.exists():
+        shutil.rmtree(snapshot)
+    partial.rename(snapshot)
+    print(f"✅ Cached {len(files)} files at {snapshot}")
+    return snapshot
+
+def stage_repository(source_dir: Path, staging_dir: str) -> str:
+    """
+    Copy the items folder into a per-workspace staging folder so the deployment
+    (logicalId fixes, rebinding) never modifies the cached snapshot.
+    """
+    staging = Path(staging_dir)
+    if staging.exists():
+        shutil.rmtree(staging)
+    shutil.copytree(source_dir, staging)
+    return str(staging)
+
+if varLocalRepoPath:
+    repo_root = Path(varLocalRepoPath)
+    print(f"📂 Deploying from local path: {repo_root}")
+else:
+    repo_commit = varCommit
+    if not repo_commit:
+        repo_commit = latest_cached_commit(varRepoCacheRoot, varRepo, varRepoName) if varOffline \
+            else resolve_commit(varRepo, varRepoName, varBranch)
+    if not repo_commit:
+        raise FileNotFoundError(f"Offline mode and the cache at {varRepoCacheRoot} is empty.  Seed it or set varCommit.")
+    repo_root = ensure_snapshot(varRepoCacheRoot, varRepo, varRepoName, repo_commit, offline=varOffline)
+
+if not (repo_root / varFolder).is_dir():
+    raise FileNotFoundError(f"'{varFolder}' not found in {repo_root}")
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "jupyter_python"
+# META }
+
+# MARKDOWN ********************
+
+# ## Build the item dependency graph
+# References between items are read from the item files: notebook META lakehouse bindings, the OneLake URL in `expressions.tmdl`, the report's `definition.pbir` and the `dependencies` in `*.metadata.json`.
+# Items on the same level have no dependency on each other and are deployed concurrently, so deploy time follows the depth of the graph rather than the number of items.
+
+# CELL ********************
+
+import re, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+GUID = r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+
+def read_notebook_meta(notebook_file: Path) -> dict:
+    """
+    Parse the first META block (kernel + lakehouse dependencies) of a Fabric notebook source file.
+    """
+    lines = []
+    for line in notebook_file.read_text(encoding="utf-8").splitlines():
+        if line.startswith("# META "):
+            lines.append(line[len("# META "):])
+        elif lines:
+            break
+    return json.loads("\n".join(lines)) if lines else {}
+
+def find_item_references(item_dir: Path, item_type: str) -> list:
+    """
+    Return the references an item makes to other items as (kind, value) tuples where kind is
+    "logicalId", "name" (displayName.Type) or "path" (item folder).
+    """
+    refs = []
+    if item_type == "Notebook":
+        for nb in item_dir.glob("notebook-content.*"):
+            dependencies = read_notebook_meta(nb).get("dependencies", {})
+            lakehouse = dependencies.get("lakehouse", {})
+            if lakehouse.get("default_lakehouse_name"):
+                refs.append(("name", f"{lakehouse['default_lakehouse_name']}.Lakehouse"))
+            if lakehouse.get("default_lakehouse"):
+                refs.append(("logicalId", lakehouse["default_lakehouse"]))
+            refs += [("logicalId", k["id"]) for k in lakehouse.get("known_lakehouses", []) if k.get("id")]
+            environment = dependencies.get("environment", {})
+            if environment.get("environmentId"):
+                refs.append(("logicalId", environment["environmentId"]))
+    elif item_type == "SemanticModel":
+        expressions = item_dir / "definition" / "expressions.tmdl"
+        if expressions.exists():
+            text = expressions.read_text(encoding="utf-8")
+            refs += [("logicalId", lh) for _, lh in re.findall(rf"onelake\.dfs\.fabric\.microsoft\.com/({GUID})/({GUID})", text)]
+            refs += [("name", f"{name}.Lakehouse") for name in re.findall(r"expression 'DirectLake - (.+?)'", text)]
+    elif item_type == "Report":
+        pbir = item_dir / "definition.pbir"
+        if pbir.exists():
+            by_path = json.loads(pbir.read_text(encoding="utf-8")).get("datasetReference", {}).get("byPath")
+            if by_path:
+                refs.append(("path", str((item_dir / by_path["path"]).resolve())))
+    for metadata in item_dir.glob("*.metadata.json"):
+        content = json.loads(metadata.read_text(encoding="utf-8") or "{}")
+        if isinstance(content, dict):
+            refs += [("logicalId", d["ArtifactObjectId"]) for d in content.get("dependencies", []) if d.get("ArtifactObjectId")]
+    return refs
+
+def build_item_graph(repository_directory: str) -> dict:
+    """
+    Discover every item (folder with a .platform file) and resolve its references to other items.
+    Items under .children (e.g. the KQL database of an Eventhouse) are deployed with their parent.
+    References that don't resolve to an item in the repo (already deployed items, other workspaces)
+    are kept in "external" and don't constrain the schedule.
+    """
+    root = Path(repository_directory)
+    items = {}
+    for platform in sorted(root.rglob(".platform")):
+        item_dir = platform.parent
+        if ".children" in item_dir.relative_to(root).parts:
+            continue
+        meta = json.loads(platform.read_text(encoding="utf-8"))
+        key = f"{meta['metadata']['displayName']}.{meta['metadata']['type']}"
+        items[key] = {
+            "type": meta["metadata"]["type"],
+            "path": str(item_dir.resolve()),
+            "logicalId": meta.get("config", {}).get("logicalId"),
+            "depends_on": set(),
+            "external": set(),
+        }
+
+    by_logical_id = {v["logicalId"]: k for k, v in items.items() if v["logicalId"]}
+    by_path = {v["path"]: k for k, v in items.items()}
+    lookup = {"logicalId": by_logical_id, "path": by_path, "name": {k: k for k in items}}
+    for key, item in items.items():
+        for kind, value in find_item_references(Path(item["path"]), item["type"]):
+            target = lookup[kind].get(value)
+            if target and target != key:
+                item["depends_on"].add(target)
+            elif not target:
+                item["external"].add(value)
+        if item["depends_on"]:
+            # An id that didn't resolve is the deployed id of an item already matched by name
+            item["external"] = {e for e in item["external"] if not re.fullmatch(GUID, e)}
+    return items
+
+def graph_levels(items: dict) -> list:
+    """
+    Group items into levels (Kahn's algorithm): every item only depends on items in earlier levels.
+    """
+    remaining = {k: set(v["depends_on"]) for k, v in items.items()}
+    levels = []
+    while remaining:
+        ready = sorted(k for k, deps in remaining.items() if not deps)
+        if not ready:
+            raise ValueError(f"Dependency cycle between items: {', '.join(sorted(remaining))}")
+        levels.append(ready)
+        for k in ready:
+            del remaining[k]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return levels
+
+def critical_path(items: dict, levels: list) -> list:
+    """
+    Longest dependency chain in the graph; its length is the number of sequential deployment steps.
+    """
+    longest = {}
+    for level in levels:
+        for k in level:
+            deps = items[k]["depends_on"]
+            longest[k] = max((longest[d] for d in deps), key=len, default=[]) + [k]
+    return max(longest.values(), key=len, default=[])
+
+def print_deploy_plan(items: dict) -> list:
+    levels = graph_levels(items)
+    print(f"📋 {len(items)} items in {len(levels)} levels")
+    for n, level in enumerate(levels, 1):
+        print(f"\n  Level {n} ({len(level)} concurrent)")
+        for k in level:
+            deps = ", ".join(sorted(items[k]["depends_on"])) or "-"
+            external = f"  (external: {', '.join(sorted(items[k]['external']))})" if items[k]["external"] else ""
+            print(f"   - {k}  <- {deps}{external}")
+    print(f"\n🧭 Critical path ({len(critical_path(items, levels))} steps): {' -> '.join(critical_path(items, levels))}")
+    return levels
+
+def deploy_by_levels(repository_directory: str, workspace_id: str, environment: str = "DEV", max_workers: int = 8,
+                     allow_non_empty_workspace: bool = False, fix_zero_logical_ids: bool = True,
+                     rebind_rules: list = None) -> list:
+    """
+    Deploy items level by level.  Items within a level are published concurrently, one
+    fabric-cicd publish per item (items_to_include), after all of their dependencies exist in the
+    workspace so fabric-cicd can replace logicalIds with the deployed item ids.
+    When rebind_rules are given, each level is rewritten just before it is published, using the
+    ids of the items deployed in the earlier levels.
+    """
+    from fabric_cicd import FabricWorkspace, publish_all_items, append_feature_flag
+    from fabric_launcher import FabricNotebookTokenCredential
+    from fabric_launcher.platform_file_fixer import PlatformFileFixer
+
+    # fix zero logicalIds first: the dependency graph is built from the logicalIds in the files
+    if fix_zero_logical_ids:
+        PlatformFileFixer(repository_directory).scan_and_fix_all(dry_run=False)
+    items = build_item_graph(repository_directory)
+    levels = print_deploy_plan(items)
+
+    if not allow_non_empty_workspace and len(fabric.list_items(workspace=workspace_id)) > 0:
+        raise RuntimeError(f"Workspace {workspace_id} is not empty.  Set allow_non_empty_workspace=True to deploy anyway.")
+
+    append_feature_flag("enable_experimental_features")
+    append_feature_flag("enable_items_to_include")
+    credential = FabricNotebookTokenCredential(notebookutils)
+
+    def publish_item(key: str) -> tuple:
+        start = time.time()
+        workspace = FabricWorkspace(
+            workspace_id=workspace_id,
+            repository_directory=repository_directory,
+            item_type_in_scope=[items[key]["type"]],
+            environment=environment,
+            token_credential=credential,
+        )
+        publish_all_items(workspace, items_to_include=[key])
+        name = key[: -len(items[key]["type"]) - 1]
+        deployed = workspace.repository_items.get(items[key]["type"], {}).get(name)
+        return time.time() - start, getattr(deployed, "guid", None)
+
+    results = []
+    deployed_ids = {}
+    for n, level in enumerate(levels, 1):
+        level_start = time.time()
+        if rebind_rules:
+            mapping = resolve_rebind_rules(rebind_rules, workspace_id, deployed_ids)
+            rebind_items([items[k]["path"] for k in level], mapping)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(publish_item, k): k for k in level}
+            failed = []
+            for f in as_completed(futures):
+                k = futures[f]
+                try:
+                    seconds, deployed_ids[k] = f.result()
+                    results.append({"level": n, "item": k, "status": "success", "seconds": round(seconds, 1)})
+                except Exception as e:
+                    failed.append(k)
+                    results.append({"level": n, "item": k, "status": "error", "error": str(e)})
+        print(f"{'❌' if failed else '✅'} Level {n}: {len(level) - len(failed)}/{len(level)} items in {time.time() - level_start:.1f}s")
+        if failed:
+            raise RuntimeError(f"Deployment stopped at level {n}; failed items: {', '.join(failed)}")
+    return results
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "jupyter_python"
+# META }
+
+# MARKDOWN ********************
+
+# ## Rebind workspace and lakehouse ids
+# Notebook META headers and `expressions.tmdl` hard-code the ids of the template workspace and lakehouse.  The rules in `varParametersFile` map those source ids to the target ones and are applied to every item file in a single streaming pass right before the item is deployed, so the new workspace needs no manual fixes afterwards.
+
+# CELL ********************
+
+import os, tempfile
+import yaml
+
+REBIND_TOKEN = re.compile(r"^\$(workspace\.\$id|items\.([^.]+)\.(.+)\.\$id)$")
+
+def load_rebind_rules(parameters_file: str) -> list:
+    """
+    Read the find_replace rules of a parameters.<env>.yml file.
+    """
+    with open(parameters_file, encoding="utf-8") as f:
+        rules = (yaml.safe_load(f) or {}).get("find_replace", [])
+    for r in rules:
+        if not r.get("find") or r.get("replace") is None:
+            raise ValueError(f"Each find_replace rule needs a find and a replace value: {r}")
+    print(f"🔗 Loaded {len(rules)} rebinding rule(s) from {parameters_file}")
+    return rules
+
+def resolve_rebind_rules(rules: list, workspace_id: str, deployed_ids: dict) -> dict:
+    """
+    Turn the rules into a {source: target} mapping.  $items tokens for items that haven't been
+    deployed yet are left out; they resolve on a later level, once the item exists.
+    """
+    mapping = {}
+    for r in rules:
+        target = str(r["replace"])
+        token = REBIND_TOKEN.match(target)
+        if token and token.group(1) == "workspace.$id":
+            target = workspace_id
+        elif token:
+            target = deployed_ids.get(f"{token.group(3)}.{token.group(2)}")
+        if target:
+            mapping[str(r["find"])] = target
+    return mapping
+
+def rebind_items(item_paths: list, mapping: dict) -> dict:
+    """
+    Replace every source id with its target in all text files of the given items.  All ids are
+    matched by one compiled pattern and each file is streamed line by line into a temp file that
+    replaces the original only if something changed.  Returns {file: replacements}.
+    """
+    if not mapping:
+        return {}
+    pattern = re.compile("|".join(re.escape(k) for k in sorted(mapping, key=len, reverse=True)))
+    changed = {}
+    for item_path in item_paths:
+        for f in Path(item_path).rglob("*"):
+            if not f.is_file() or f.name == ".platform":
+                continue
+            count = 0
+            fd, tmp = tempfile.mkstemp(dir=f.parent)
+            try:
+                with open(f, encoding="utf-8", newline="") as src, os.fdopen(fd, "w", encoding="utf-8", newline="") as dst:
+                    for line in src:
+                        line, n = pattern.subn(lambda m: mapping[m.group(0)], line)
+                        count += n
+                        dst.write(line)
+            except UnicodeDecodeError:
+                count = 0  # binary file, nothing to rebind
+            if count:
+                shutil.copymode(f, tmp)
+                os.replace(tmp, f)
+                changed[str(f)] = count
+            else:
+                os.remove(tmp)
+    if changed:
+        print(f"🔗 Rebound {sum(changed.values())} id(s) in {len(changed)} file(s)")
+    return changed
+
+rebind_rules = load_rebind_rules(str(repo_root / varParametersFile)) if varParametersFile else []
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "jupyter_python"
+# META }
+
+# MARKDOWN ********************
+
+# ## Validate the items offline before deploying
+# Every file in the items folder is parsed in parallel and the parse results are cached by file hash, so a rerun on an unchanged repo only hashes files.
+# All problems are reported in one pass: malformed JSON / `.platform` files, TMDL references to missing tables, columns or expressions, notebook lakehouse bindings that disagree with the rest of the repo, and reports bound to a missing model or missing fields.
+
+# CELL ********************
+
+TMDL_OBJECT = re.compile(r"^\t(column|measure)\s+('(?:[^']|'')+'|[^\s=]+)", re.M)
+DAX_COLUMN_REF = re.compile(r"(?:'((?:[^']|'')+)'|\b([A-Za-z_][\w]*))?\[([^\]]+)\]")
+
+def tmdl_name(token: str) -> str:
+    return token[1:-1].replace("''", "'") if token.startswith("'") else token
+
+def parse_artifact(path: Path) -> dict:
+    """
+    Parse one item file into the small set of facts the cross-item checks need.
+    The result only depends on the file name and content, which is what makes it safe to cache by both.
+    """
+    name = path.name
+    if not (name == "notebook-content.py" or name == ".platform" or name.endswith((".tmdl", ".json", ".pbir", ".pbism"))):
+        return {"kind": "other"}  # not read at all, so images and other binaries never need decoding
+    try:
+        text = path.read_text(encoding="utf-8")
+        if name == "notebook-content.py":
+            dependencies = read_notebook_meta(path).get("dependencies", {})
+            return {"kind": "notebook", "lakehouse": dependencies.get("lakehouse", {}), "environment": dependencies.get("environment", {})}
+        if name.endswith(".tmdl"):
+            table = re.match(r"table\s+('(?:[^']|'')+'|\S+)", text)
+            return {
+                "kind": "tmdl",
+                "table": tmdl_name(table.group(1)) if table else None,
+                "objects": [tmdl_name(t) for _, t in TMDL_OBJECT.findall(text)],
+                "columns": [tmdl_name(t) for k, t in TMDL_OBJECT.findall(text) if k == "column"],
+                "dax_refs": [[tmdl_name(f"'{q}'") if q else b, c] for q, b, c in DAX_COLUMN_REF.findall(
+                    "\n".join(l for l in text.splitlines() if "=" in l or l.startswith("\t\t\t")))],
+                "sort_by": re.findall(r"sortByColumn:\s*(.+)", text),
+                "expression_sources": [tmdl_name(e.strip()) for e in re.findall(r"expressionSource:\s*(.+)", text)],
+                "ref_tables": [tmdl_name(t.strip()) for t in re.findall(r"^ref table\s+(.+)$", text, re.M)],
+                "expressions": [tmdl_name(e) for e in re.findall(r"^expression\s+('(?:[^']|'')+'|\S+)", text, re.M)],
+                "onelake": re.findall(rf"onelake\.dfs\.fabric\.microsoft\.com/({GUID})/({GUID})", text),
+            }
+        if name.endswith((".json", ".pbir", ".pbism")) or name == ".platform":
+            data = json.loads(text)
+            facts = {"kind": "json"}
+            if name == ".platform":
+                facts.update(kind="platform", type=data.get("metadata", {}).get("type"),
+                             displayName=data.get("metadata", {}).get("displayName"),
+                             logicalId=data.get("config", {}).get("logicalId"))
+            elif name == "definition.pbir":
+                facts.update(kind="pbir", dataset=data.get("datasetReference", {}))
+            elif name == "report.json":
+                fields = set()
+                for section in data.get("sections", []):
+                    for visual in section.get("visualContainers", []):
+                        query = json.loads(visual.get("config", "{}")).get("singleVisual", {}).get("prototypeQuery", {})
+                        sources = {f["Name"]: f["Entity"] for f in query.get("From", [])}
+                        def walk(node):
+                            if isinstance(node, dict):
+                                source = node.get("Expression", {}).get("SourceRef", {}).get("Source")
+                                if "Property" in node and source in sources:
+                                    fields.add((sources[source], node["Property"]))
+                                for v in node.values():
+                                    walk(v)
+                            elif isinstance(node, list):
+                                for v in node:
+                                    walk(v)
+                        walk(query)
+                facts.update(kind="report", fields=sorted(fields))
+            return facts
+        return {"kind": "other"}
+    except Exception as e:
+        return {"kind": "error", "error": f"{type(e).__name__}: {e}"}
+
+def parse_tree(repository_directory: str, cache_file: str = None, max_workers: int = 16) -> dict:
+    """
+    Parse every file under the items folder in parallel, reusing cached results for files whose
+    name and sha256 are unchanged.  Returns {relative path: facts}.
+    """
+    root = Path(repository_directory)
+    cache = json.loads(Path(cache_file).read_text()) if cache_file and Path(cache_file).exists() else {}
+    files = [f for f in root.rglob("*") if f.is_file()]
+
+    def load(f: Path):
+        key = f"{f.name}:{hashlib.sha256(f.read_bytes()).hexdigest()}"  # what gets parsed depends on the name too
+        return str(f.relative_to(root)), key, cache.get(key) or parse_artifact(f)
+
+    parsed, fresh = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for rel, key, facts in pool.map(load, files):
+            parsed[rel] = facts
+            fresh[key] = facts
+    if cache_file:
+        Path(cache_file).parent.mkdir(parents=True, exist_ok=True)
+        Path(cache_file).write_text(json.dumps(fresh))
+    return parsed
+
+def validate_items(repository_directory: str, cache_file: str = None) -> list:
+    """
+    Run every offline check and return all problems found as {"file", "problem"} dicts.
+    """
+    start = time.time()
+    parsed = parse_tree(repository_directory, cache_file)
+    problems = []
+    def report(rel, problem):
+        problems.append({"file": rel, "problem": problem})
+
+    items = {}
+    for rel, facts in parsed.items():
+        if facts["kind"] == "error":
+            report(rel, f"cannot be parsed: {facts['error']}")
+        elif facts["kind"] == "platform":
+            if not facts["type"] or not facts["displayName"]:
+                report(rel, "metadata.type and metadata.displayName are required")
+            if not facts["logicalId"] or not re.fullmatch(GUID, facts["logicalId"]):
+                report(rel, f"config.logicalId is missing or not a GUID: {facts['logicalId']}")
+            items[str(Path(rel).parent)] = facts
+    lakehouses = {f["displayName"] for f in items.values() if f["type"] == "Lakehouse"}
+    folder_of = lambda rel: next((d for d in sorted(items, key=len, reverse=True) if rel.startswith(d + "/")), None)
+
+    # Semantic models: tables, columns, expressions
+    models = {}
+    for rel, facts in parsed.items():
+        if facts["kind"] == "tmdl" and folder_of(rel):
+            model = models.setdefault(folder_of(rel), {"tables": {}, "refs": [], "expressions": set(), "onelake": []})
+            if facts["table"]:
+                model["tables"][facts["table"]] = set(facts["objects"])
+                model["refs"] += [(rel, facts["table"], facts)]
+            model["expressions"].update(facts["expressions"])
+            model["onelake"] += facts["onelake"]
+            model.setdefault("ref_tables", []).extend((rel, t) for t in facts["ref_tables"])
+    for folder, model in models.items():
+        for rel, t in model.get("ref_tables", []):
+            if t not in model["tables"]:
+                report(rel, f"ref table '{t}' has no table definition")
+        for rel, table, facts in model["refs"]:
+            for t, c in facts["dax_refs"]:
+                target = t or table
+                if target in model["tables"] and c not in model["tables"][target]:
+                    report(rel, f"reference {target}[{c}] points at a missing column or measure")
+                elif target not in model["tables"]:
+                    report(rel, f"reference {target}[{c}] points at a missing table")
+            for c in facts["sort_by"]:
+                if tmdl_name(c.strip()) not in facts["columns"]:
+                    report(rel, f"sortByColumn '{c.strip()}' is not a column of '{table}'")
+            for e in facts["expression_sources"]:
+                if e not in model["expressions"]:
+                    report(rel, f"partition expressionSource '{e}' is not defined in expressions.tmdl")
+
+    # Notebooks: default lakehouse binding must be consistent across the repo
+    environments = {f["logicalId"] for f in items.values() if f["type"] == "Environment"}
+    bound_ids = {}
+    for rel, facts in parsed.items():
+        if facts["kind"] != "notebook":
+            continue
+        env = facts.get("environment", {})
+        if env.get("workspaceId") == "00000000-0000-0000-0000-000000000000" and env.get("environmentId") not in environments:
+            report(rel, f"environment {env.get('environmentId')} is not an Environment in this repo")
+        if not facts["lakehouse"]:
+            continue
+        lh = facts["lakehouse"]
+        name, lh_id = lh.get("default_lakehouse_name"), lh.get("default_lakehouse")
+        if name and name not in lakehouses:
+            report(rel, f"default_lakehouse_name '{name}' is not a Lakehouse in this repo")
+        if lh_id and lh_id not in [k.get("id") for k in lh.get("known_lakehouses", [])]:
+            report(rel, f"default_lakehouse {lh_id} is missing from known_lakehouses")
+        if name:
+            bound_ids.setdefault(name, {}).setdefault((lh_id, lh.get("default_lakehouse_workspace_id")), []).append(rel)
+    for name, bindings in bound_ids.items():
+        # The binding most notebooks agree on wins; every other one is reported as stale
+        expected = max(bindings, key=lambda b: len(bindings[b]))
+        for (lh_id, ws_id), rels in bindings.items():
+            if (lh_id, ws_id) != expected:
+                for rel in rels:
+                    report(rel, f"stale binding for '{name}': {ws_id}/{lh_id}, other notebooks use {expected[1]}/{expected[0]}")
+    notebook_ids = {ids for b in bound_ids.values() for ids in b}
+    for folder, model in models.items():
+        for ws_id, lh_id in model["onelake"]:
+            if notebook_ids and (lh_id, ws_id) not in notebook_ids:
+                report(f"{folder}/definition/expressions.tmdl", f"OneLake source {ws_id}/{lh_id} matches no notebook lakehouse binding")
+
+    # Reports: bound model must exist and contain every field the visuals use
+    for rel, facts in parsed.items():
+        if facts["kind"] != "pbir":
+            continue
+        by_path = facts["dataset"].get("byPath", {}).get("path")
+        if not by_path:
+            continue
+        model_folder = os.path.normpath(str(Path(rel).parent / by_path))
+        if items.get(model_folder, {}).get("type") != "SemanticModel":
+            report(rel, f"datasetReference path '{by_path}' is not a semantic model in this repo")
+            continue
+        report_json = parsed.get(str(Path(rel).parent / "report.json"), {})
+        tables = models.get(model_folder, {}).get("tables", {})
+        for table, field in report_json.get("fields", []):
+            if field not in tables.get(table, set()):
+                report(str(Path(rel).parent / "report.json"), f"visual field {table}.{field} is not in '{items[model_folder]['displayName']}'")
+
+    print(f"{'❌' if problems else '✅'} Validated {len(parsed)} files in {(time.time() - start) * 1000:.0f} ms: {len(problems)} problem(s)")
+    for p in problems:
+        print(f"   - {p['file']}: {p['problem']}")
+    return problems
+
+if varValidateBeforeDeploy:
+    validation_problems = validate_items(repo_root / varFolder, cache_file=f"{varRepoCacheRoot}/_validation_cache.json")
+    if validation_problems:
+        raise ValueError(f"{len(validation_problems)} problem(s) found in '{varFolder}'.  Fix them before deploying.")
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "jupyter_python"
+# META }
+
+# MARKDOWN ********************
+
 # ## Deploy the workspace to Fabric
 
 # CELL ********************
@@ -232,14 +890,31 @@ launcher = FabricLauncher(
     #config_file="Files/config/deployment_config.yaml"  # local path
 )
 
-# Deploy using config
-
-launcher.download_and_deploy(
-    repo_owner= varRepo,
-    repo_name=varRepoName,
-    branch=varBranch,
-    workspace_folder=varFolder
-)
+# Deploy from the cached snapshot (staged per workspace) instead of downloading the repo again
+
+repository_directory = stage_repository(repo_root / varFolder, f".lakehouse/default/Files/src/{TARGET_WORKSPACE_ID}/{varFolder}")
+
+if varDeployDryRun:
+    print_deploy_plan(build_item_graph(repository_directory))
+elif varParallelDeploy:
+    deploy_results = deploy_by_levels(
+        repository_directory,
+        workspace_id=TARGET_WORKSPACE_ID,
+        environment=launcher.environment,
+        max_workers=varDeployWorkers,
+        allow_non_empty_workspace=launcher.allow_non_empty_workspace,
+        fix_zero_logical_ids=launcher.fix_zero_logical_ids,
+        rebind_rules=rebind_rules,
+    )
+    launcher.validate_deployment()
+else:
+    # Without the level by level deploy only rules that don't depend on deployed items can be applied
+    static_mapping = resolve_rebind_rules(rebind_rules, TARGET_WORKSPACE_ID, {})
+    if len(static_mapping) < len(rebind_rules):
+        print(f"⚠️ {len(rebind_rules) - len(static_mapping)} rebinding rule(s) reference deployed items and need varParallelDeploy = True")
+    rebind_items([repository_directory], static_mapping)
+    launcher.deploy_artifacts(repository_directory=repository_directory)
+    launcher.validate_deployment()
 
 
 # METADATA ********************
@@ -293,7 +968,6 @@ semantic_models = resp.json()["value"]
 for m in semantic_models:
     print(f"{m['displayName']}  |  id={m['id']}  |  Refreshing")
     fabric.refresh_dataset(workspace=workspace_name, dataset=m['displayName'])
-dataset_name=m['displayName']
 
 # METADATA ********************
 
@@ -302,15 +976,151 @@ dataset_name=m['displayName']
 # META   "language_group": "jupyter_python"
 # META }
 
+# MARKDOWN ********************
+
+# ## Post-deployment validation suite
+# Each item type contributes its own checks: row counts per lakehouse table (SQL endpoint), a DAX probe per semantic model table, report to semantic model binding, and an optional run-once for the notebooks in `varSmokeNotebooks`.
+# All checks of all workspaces run concurrently and share one `varValidationTimeout` window; the result is a timed pass/fail matrix.
+
 # CELL ********************
 
+import pandas as pd
+from concurrent.futures import wait
+from fabric_launcher import get_sql_endpoint, exec_sql_query
 
-df = fabric.evaluate_dax(
-    dataset=dataset_name,
-    dax_string="EVALUATE TOPN(5, 'accounts')"
-)
+VALIDATION_CHECKS = {}
 
-display(df)
+def validation_check(item_type: str):
+    """
+    Register a function that returns the checks for one item of the given type as a list of
+    (check name, callable) pairs.  Each callable returns a short detail string or raises.
+    """
+    def register(fn):
+        VALIDATION_CHECKS[item_type] = fn
+        return fn
+    return register
+
+@validation_check("Lakehouse")
+def lakehouse_checks(workspace_id: str, item: dict, context: dict) -> list:
+    resp = client.get(f"/v1/workspaces/{workspace_id}/lakehouses/{item['Id']}/tables")
+    resp.raise_for_status()
+    tables = [t["name"] for t in resp.json().get("data", [])]
+    if not tables:
+        return [("tables", lambda: "no tables yet")]
+    endpoint = get_sql_endpoint(workspace_id, item["Display Name"], "Lakehouse", client)
+    def row_count(table):
+        rows = exec_sql_query(endpoint, item["Display Name"], f"SELECT COUNT_BIG(*) AS n FROM [dbo].[{table}]", notebookutils, timeout=varValidationTimeout)
+        return f"{list(rows[0].values())[0]:,} rows"
+    return [(f"rows: {t}", lambda t=t: row_count(t)) for t in tables]
+
+@validation_check("SemanticModel")
+def semantic_model_checks(workspace_id: str, item: dict, context: dict) -> list:
+    tables = fabric.list_tables(dataset=item["Display Name"], workspace=workspace_id)["Name"].tolist()
+    def probe(table):
+        df = fabric.evaluate_dax(dataset=item["Display Name"], workspace=workspace_id,
+                                 dax_string=f"EVALUATE ROW(\"Rows\", COUNTROWS('{table}'))")
+        return f"{int(df.iloc[0, 0] or 0):,} rows"
+    return [(f"dax: {t}", lambda t=t: probe(t)) for t in tables]
+
+@validation_check("Report")
+def report_checks(workspace_id: str, item: dict, context: dict) -> list:
+    def binding():
+        dataset_id = context["reports"].get(item["Id"])
+        if dataset_id not in context["semantic_models"]:
+            raise RuntimeError(f"bound to dataset {dataset_id}, which is not a semantic model in this workspace")
+        return f"bound to {context['semantic_models'][dataset_id]}"
+    return [("binding", binding)]
+
+@validation_check("Notebook")
+def notebook_checks(workspace_id: str, item: dict, context: dict) -> list:
+    if item["Display Name"] not in varSmokeNotebooks:
+        return []
+    def run_once():
+        path = f"v1/workspaces/{workspace_id}/items/{item['Id']}/jobs/instances"
+        resp = client.post(f"{path}?jobType=RunNotebook")
+        resp.raise_for_status()
+        job = resp.headers["Location"].rstrip("/").split("/")[-1]
+        status = None
+        while time.time() < context["deadline"]:  # stop polling with the suite, so the thread doesn't outlive it
+            status = client.get(f"{path}/{job}").json().get("status")
+            if status == "Completed":
+                return "run completed"
+            if status in ("Failed", "Cancelled", "Deduped"):
+                raise RuntimeError(f"run {status.lower()}")
+            time.sleep(5)
+        raise TimeoutError(f"run still {status or 'not started'} at the suite deadline")
+    return [("run once", run_once)]
+
+def run_validation_suite(workspace_ids: list, timeout_seconds: int = 120, max_workers: int = 32) -> pd.DataFrame:
+    """
+    Collect the checks of every item in every workspace and run them all concurrently.
+    Checks still running when the timeout expires are reported as "timeout"; a workspace whose
+    checks can't be listed is reported as one failed "plan checks" row.
+    """
+    start = time.time()
+    deadline = start + timeout_seconds
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    columns = ["WorkspaceId", "Item", "Type", "Check", "Status", "Seconds", "Detail"]
+
+    def plan(workspace_id):
+        t = time.time()
+        try:
+            return plan_workspace(workspace_id), None
+        except Exception as e:
+            return [], {"WorkspaceId": workspace_id, "Item": "", "Type": "Workspace", "Check": "plan checks",
+                        "Status": "fail", "Seconds": round(time.time() - t, 2), "Detail": str(e)[:300]}
+
+    def plan_workspace(workspace_id):
+        items = fabric.list_items(workspace=workspace_id)
+        reports = fabric.list_reports(workspace=workspace_id)
+        context = {
+            "semantic_models": dict(items[items["Type"] == "SemanticModel"][["Id", "Display Name"]].values),
+            "reports": dict(reports[["Id", "Dataset Id"]].values),
+            "deadline": deadline,
+        }
+        checks = []
+        for item in items.to_dict("records"):
+            if item["Type"] in VALIDATION_CHECKS:
+                try:
+                    found = VALIDATION_CHECKS[item["Type"]](workspace_id, item, context)
+                except Exception as e:
+                    def _raise(e=e):  # reported as a failed "discover checks" row when the checks run
+                        raise e
+                    found = [("discover checks", _raise)]
+                checks += [(workspace_id, item, name, fn) for name, fn in found]
+        return checks
+
+    planned = list(pool.map(plan, workspace_ids))
+    checks = [c for found, _ in planned for c in found]
+    rows = [error for _, error in planned if error]
+
+    def timed(fn):
+        t = time.time()
+        try:
+            return "pass", fn(), time.time() - t
+        except Exception as e:
+            return "fail", str(e)[:300], time.time() - t
+
+    checks_start = time.time()
+    futures = {pool.submit(timed, fn): (ws, item, name) for ws, item, name, fn in checks}
+    wait(futures, timeout=max(0, deadline - time.time()))
+    for f, (ws, item, name) in futures.items():
+        row = {"WorkspaceId": ws, "Item": item["Display Name"], "Type": item["Type"], "Check": name}
+        if not f.done():
+            row.update(Status="timeout", Seconds=round(time.time() - checks_start, 2), Detail=f"exceeded {timeout_seconds}s")
+        else:
+            status, detail, seconds = f.result()
+            row.update(Status=status, Seconds=round(seconds, 2), Detail=detail)
+        rows.append(row)
+    pool.shutdown(wait=False, cancel_futures=True)
+
+    matrix = pd.DataFrame(rows, columns=columns)
+    passed = int((matrix["Status"] == "pass").sum())
+    print(f"{'✅' if passed == len(matrix) else '❌'} {passed}/{len(matrix)} checks passed across {len(workspace_ids)} workspace(s) in {time.time() - start:.1f}s")
+    return matrix
+
+validation_matrix = run_validation_suite([new_workspace_id], timeout_seconds=varValidationTimeout)
+display(validation_matrix)
 
 # METADATA ********************
 
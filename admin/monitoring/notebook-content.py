@@ -523,3 +523,198 @@ print("✅ Done.")
 # META   "language": "sparksql",
 # META   "language_group": "synapse_pyspark"
 # META }
+
+# MARKDOWN ********************
+
+# ## Inventory snapshot (capacities, workspaces, items)
+# 
+# By default the crawler lists what the identity running this notebook can see (`v1/workspaces`), not the whole tenant. Set `ADMIN_API = True` to crawl every workspace of the tenant through the admin endpoints (`v1/admin/workspaces`, `v1/admin/items`), which needs Fabric administrator rights.
+
+# CELL ********************
+
+# ============================================================
+# Inventory crawler -> Delta (inv_capacity, inv_workspace, inv_item)
+# - Pages through capacities, workspaces and items with the Fabric REST API
+# - Scope: the caller's workspaces, or the whole tenant with ADMIN_API
+# - Items are listed for many workspaces concurrently
+# - TTL based: only scopes older than INVENTORY_TTL_MINUTES are crawled again
+# - Feeds dim_workspace / dim_item (items no longer in the inventory are removed from dim_item)
+# Idempotent: safe to rerun
+# ============================================================
+
+import sempy.fabric as fabric
+from concurrent.futures import ThreadPoolExecutor
+from delta.tables import DeltaTable
+
+# --------------- CONFIG ----------------
+INVENTORY_TTL_MINUTES = 60   # cached inventory younger than this is not crawled again
+FORCE_REFRESH = False        # True => crawl everything regardless of TTL
+MAX_WORKERS = 16             # concurrent item listings
+ADMIN_API = False            # True => whole tenant via the admin APIs (Fabric admin only), False => the caller's workspaces
+
+client = fabric.FabricRestClient()
+
+# --------------- HELPERS ----------------
+def list_all(path: str, key: str = "value") -> list:
+    """GET a Fabric list endpoint and follow continuationToken pages."""
+    out, token = [], None
+    while True:
+        sep = "&" if "?" in path else "?"
+        r = client.get(f"{path}{sep}continuationToken={token}" if token else path)
+        r.raise_for_status()
+        page = r.json()
+        out += page.get(key, [])
+        token = page.get("continuationToken")
+        if not token:
+            return out
+
+def ensure_inventory_tables():
+    spark.sql("""
+    CREATE TABLE IF NOT EXISTS inv_capacity (
+      CapacityId    STRING,
+      DisplayName   STRING,
+      Sku           STRING,
+      Region        STRING,
+      State         STRING,
+      SnapshotUtc   TIMESTAMP
+    ) USING DELTA
+    """)
+    spark.sql("""
+    CREATE TABLE IF NOT EXISTS inv_workspace (
+      WorkspaceId   STRING,
+      WorkspaceName STRING,
+      WorkspaceType STRING,
+      CapacityId    STRING,
+      SnapshotUtc   TIMESTAMP
+    ) USING DELTA
+    """)
+    spark.sql("""
+    CREATE TABLE IF NOT EXISTS inv_item (
+      ItemId        STRING,
+      ItemKind      STRING,
+      ItemName      STRING,
+      WorkspaceId   STRING,
+      Description   STRING,
+      SnapshotUtc   TIMESTAMP
+    ) USING DELTA
+    """)
+    spark.sql("""
+    CREATE TABLE IF NOT EXISTS inv_refresh_state (
+      Scope          STRING,
+      RefreshedAtUtc TIMESTAMP
+    ) USING DELTA
+    """)
+
+def stale_scopes(scopes: list) -> set:
+    """Scopes never crawled or crawled longer than INVENTORY_TTL_MINUTES ago."""
+    if FORCE_REFRESH:
+        return set(scopes)
+    fresh = {
+        r.Scope for r in spark.table("inv_refresh_state")
+        .where(F.col("RefreshedAtUtc") >= F.expr(f"current_timestamp() - INTERVAL {INVENTORY_TTL_MINUTES} MINUTES"))
+        .select("Scope").collect()
+    }
+    return set(scopes) - fresh
+
+def mark_refreshed(scopes: list, snapshot_utc):
+    if not scopes:
+        return
+    updates = spark.createDataFrame([(s, snapshot_utc) for s in scopes], "Scope STRING, RefreshedAtUtc TIMESTAMP")
+    (DeltaTable.forName(spark, "inv_refresh_state").alias("t")
+     .merge(updates.alias("s"), "t.Scope = s.Scope")
+     .whenMatchedUpdateAll().whenNotMatchedInsertAll().execute())
+
+def replace_rows(table: str, df, key_col: str = None, keys: list = None):
+    """Overwrite a whole inventory table, or only the rows of the given keys (single Delta commit)."""
+    writer = df.write.format("delta").mode("overwrite")
+    if keys is not None:
+        if not keys:
+            return
+        in_list = ", ".join(f"'{k}'" for k in keys)
+        writer = writer.option("replaceWhere", f"{key_col} IN ({in_list})")
+    writer.saveAsTable(table)
+
+# --------------- RUN ----------------
+ensure_inventory_tables()
+snapshot_utc = datetime.utcnow()
+started = datetime.utcnow()
+
+# 1) Capacities + workspaces: one paged listing each, only when stale
+if stale_scopes(["capacities"]):
+    capacities = list_all("v1/capacities")
+    replace_rows("inv_capacity", spark.createDataFrame(
+        [(c["id"], c.get("displayName"), c.get("sku"), c.get("region"), c.get("state"), snapshot_utc) for c in capacities],
+        "CapacityId STRING, DisplayName STRING, Sku STRING, Region STRING, State STRING, SnapshotUtc TIMESTAMP"))
+    mark_refreshed(["capacities"], snapshot_utc)
+    print(f"✅ Capacities refreshed: {len(capacities)}")
+
+if stale_scopes(["workspaces"]):
+    workspaces = list_all("v1/admin/workspaces", key="workspaces") if ADMIN_API else list_all("v1/workspaces")
+    replace_rows("inv_workspace", spark.createDataFrame(
+        [(w["id"], w.get("displayName", w.get("name")), w.get("type"), w.get("capacityId"), snapshot_utc) for w in workspaces],
+        "WorkspaceId STRING, WorkspaceName STRING, WorkspaceType STRING, CapacityId STRING, SnapshotUtc TIMESTAMP"))
+    mark_refreshed(["workspaces"], snapshot_utc)
+    print(f"✅ Workspaces refreshed: {len(workspaces)}")
+
+# 2) Items: list only the workspaces whose item snapshot is stale, concurrently
+workspace_ids = [r.WorkspaceId for r in spark.table("inv_workspace").select("WorkspaceId").collect()]
+stale_ws = sorted(s.split(":", 1)[1] for s in stale_scopes([f"items:{w}" for w in workspace_ids]))
+
+def list_items(workspace_id: str):
+    try:
+        if ADMIN_API:
+            return workspace_id, list_all(f"v1/admin/items?workspaceId={workspace_id}", key="itemEntities"), None
+        return workspace_id, list_all(f"v1/workspaces/{workspace_id}/items"), None
+    except Exception as e:
+        return workspace_id, [], str(e)
+
+with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+    crawled = list(pool.map(list_items, stale_ws))
+
+ok_ws = [w for w, _, err in crawled if not err]
+item_rows = [
+    (i["id"], i.get("type"), i.get("displayName", i.get("name")), w, i.get("description"), snapshot_utc)
+    for w, items, err in crawled if not err for i in items
+]
+replace_rows("inv_item", spark.createDataFrame(
+    item_rows, "ItemId STRING, ItemKind STRING, ItemName STRING, WorkspaceId STRING, Description STRING, SnapshotUtc TIMESTAMP"),
+    key_col="WorkspaceId", keys=ok_ws)
+mark_refreshed([f"items:{w}" for w in ok_ws], snapshot_utc)
+
+# Drop items of workspaces that no longer exist
+gone_ws = [r.WorkspaceId for r in spark.table("inv_item").join(spark.table("inv_workspace"), "WorkspaceId", "left_anti")
+           .select("WorkspaceId").distinct().collect()]
+if gone_ws:
+    DeltaTable.forName(spark, "inv_item").delete(F.col("WorkspaceId").isin(gone_ws))
+
+for w, _, err in crawled:
+    if err:
+        print(f"⚠️ Items of workspace {w} not refreshed: {err}")
+print(f"✅ Items refreshed for {len(ok_ws)}/{len(workspace_ids)} workspaces ({len(item_rows)} items), "
+      f"{len(workspace_ids) - len(stale_ws)} still fresh")
+
+# 3) Feed the reporting dimensions (keeps Environment / Owner / Domain maintained elsewhere)
+(DeltaTable.forName(spark, "dim_workspace").alias("t")
+ .merge(spark.table("inv_workspace").alias("s"), "t.WorkspaceId = s.WorkspaceId")
+ .whenMatchedUpdate(set={"WorkspaceName": "s.WorkspaceName", "CapacityId": "s.CapacityId", "UpdatedAtUtc": "s.SnapshotUtc"})
+ .whenNotMatchedInsert(values={"WorkspaceId": "s.WorkspaceId", "WorkspaceName": "s.WorkspaceName",
+                               "CapacityId": "s.CapacityId", "UpdatedAtUtc": "s.SnapshotUtc"})
+ .execute())
+(DeltaTable.forName(spark, "dim_item").alias("t")
+ .merge(spark.table("inv_item").alias("s"), "t.ItemId = s.ItemId")
+ .whenMatchedUpdate(set={"ItemKind": "s.ItemKind", "ItemName": "s.ItemName", "WorkspaceId": "s.WorkspaceId", "UpdatedAtUtc": "s.SnapshotUtc"})
+ .whenNotMatchedInsert(values={"ItemId": "s.ItemId", "ItemKind": "s.ItemKind", "ItemName": "s.ItemName",
+                               "WorkspaceId": "s.WorkspaceId", "UpdatedAtUtc": "s.SnapshotUtc"})
+ # deleted items, only in workspaces this inventory covers (rows of other workspaces are maintained elsewhere)
+ .whenNotMatchedBySourceDelete(condition=F.col("t.WorkspaceId").isin(workspace_ids))
+ .execute())
+
+print(f"✅ dim_workspace / dim_item updated")
+print(f"   Completed in {(datetime.utcnow() - started).total_seconds():.1f}s at {datetime.utcnow().isoformat()}Z")
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
@@ -83,6 +83,7 @@ IS_CUSTOM_DATA = False  # if TRUE, dataset has to be uploaded manually
 DATA_ROOT = "/lakehouse/default"
 DATA_FOLDER = "Files/churn"  # folder with data files
 DATA_FILE = "churn.csv"  # data file name
+BRONZE_TABLE = "bronze_churn"  # typed Delta table built from the raw file
 
 # METADATA ********************
 
@@ -95,12 +96,151 @@ DATA_FILE = "churn.csv"  # data file name
 
 # This code downloads a publicly available version of the dataset and then stores it in a Fabric lakehouse.
 # 
+# Files are streamed to disk in chunks (constant memory), large files are fetched as concurrent byte ranges, and an interrupted download resumes from its `.part` file on the next run. Progress is only recorded for bytes that were synced to disk. A server that answers a byte range with the whole file falls back to a single stream. Every file is checked against the size reported by the server (and `EXPECTED_SHA256` when given) before it is atomically renamed into place, so a partial file is never mistaken for a complete one. A `.verified.json` sidecar records each completed download, so a file is not downloaded again when the server reports no size.
+# 
 # > [!IMPORTANT]
 # > **Make sure you [add a lakehouse](https://aka.ms/fabric/addlakehouse) to the notebook before running it. Failure to do so will result in an error.**
 
 # CELL ********************
 
-import os, requests
+import os, json, base64, hashlib, threading, requests
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK_SIZE = 8 * 1024 * 1024    # bytes streamed per write
+PART_SIZE = 64 * 1024 * 1024    # byte range per request when the server supports ranges
+MAX_WORKERS = 8                 # concurrent byte ranges / files
+EXPECTED_SHA256 = {}            # optional integrity check, e.g. {"churn.csv": "<sha256>"}
+STATE_EVERY_CHUNKS = 8          # fsync + save resume state every N chunks (and at the end of each range)
+
+
+class RangeNotHonoured(IOError):
+    """The server answered a byte range request with something other than 206 Partial Content."""
+
+
+def remote_info(url: str) -> dict:
+    r = requests.head(url, timeout=30, allow_redirects=True)
+    r.raise_for_status()
+    return {
+        "size": int(r.headers["Content-Length"]) if "Content-Length" in r.headers else None,
+        "ranges": r.headers.get("Accept-Ranges") == "bytes",
+        "md5": r.headers.get("Content-MD5"),
+        "etag": r.headers.get("ETag"),
+        "last_modified": r.headers.get("Last-Modified"),
+    }
+
+def already_downloaded(target: str, info: dict) -> bool:
+    """
+    True when target is complete: it matches the server's size, or, when the server reports none,
+    the size and ETag / Last-Modified recorded in its .verified.json sidecar by the last verified download.
+    """
+    if not os.path.exists(target):
+        return False
+    if info["size"] is not None:
+        return os.path.getsize(target) == info["size"]
+    sidecar = f"{target}.verified.json"
+    if not os.path.exists(sidecar):
+        return False
+    with open(sidecar) as f:
+        verified = json.load(f)
+    return (verified.get("size") == os.path.getsize(target)
+            and all(verified.get(k) == info[k] for k in ("etag", "last_modified") if info[k]))
+
+def download_file(url: str, target: str, pool: ThreadPoolExecutor) -> str:
+    """
+    Download url to target through target.part, resuming a previous partial download.
+    Progress per byte range is kept in target.part.json.
+    """
+    info = remote_info(url)
+    if already_downloaded(target, info):
+        return "exists"
+
+    part, state_file = f"{target}.part", f"{target}.part.json"
+    state = {}
+    if os.path.exists(state_file) and os.path.exists(part):
+        with open(state_file) as f:
+            state = json.load(f)
+        if state.get("size") != info["size"]:
+            state = {}  # remote file changed since the partial download, start over
+    if not state:
+        state = {"size": info["size"], "done": {}}
+        with open(part, "wb") as f:
+            if info["size"] and info["ranges"]:
+                f.truncate(info["size"])
+    lock = threading.Lock()
+
+    def save_state():
+        with open(state_file, "w") as f:
+            json.dump(state, f)
+
+    def fetch(start: int, end: int):
+        written = state["done"].get(str(start), 0)
+        if 0 <= end < start + written:
+            return  # range already complete
+        headers = {"Range": f"bytes={start + written}-{end}"} if end >= 0 else {}
+        with requests.get(url, headers=headers, stream=True, timeout=60) as r, open(part, "r+b") as f:
+            r.raise_for_status()
+            if headers and r.status_code != 206:
+                raise RangeNotHonoured(f"{url}: range request answered with {r.status_code}")
+            f.seek(start + written)
+
+            def checkpoint():
+                # only record bytes that are on disk, so a resume never skips a hole
+                f.flush()
+                os.fsync(f.fileno())
+                with lock:
+                    state["done"][str(start)] = written
+                    save_state()
+
+            for n, chunk in enumerate(r.iter_content(CHUNK_SIZE), 1):
+                f.write(chunk)
+                written += len(chunk)
+                if n % STATE_EVERY_CHUNKS == 0:
+                    checkpoint()
+            checkpoint()
+
+    def single_stream():
+        state["done"] = {}
+        open(part, "wb").close()
+        fetch(0, -1)  # single stream from the start
+
+    if info["size"] and info["ranges"]:
+        ranges = [(s, min(s + PART_SIZE, info["size"]) - 1) for s in range(0, info["size"], PART_SIZE)]
+        futures = [pool.submit(fetch, s, e) for s, e in ranges]
+        errors = [f.exception() for f in futures]
+        if any(isinstance(e, RangeNotHonoured) for e in errors):
+            print(f"⚠️ {url}: byte ranges not honoured, downloading as a single stream")
+            single_stream()
+        else:
+            for e in errors:
+                if e:
+                    raise e
+    else:
+        single_stream()  # no range support
+
+    # Verify before the file becomes visible under its final name
+    actual = os.path.getsize(part)
+    if info["size"] is not None and actual != info["size"]:
+        raise IOError(f"{target}: expected {info['size']} bytes, got {actual}")
+    expected_sha = EXPECTED_SHA256.get(os.path.basename(target))
+    if expected_sha or info["md5"]:
+        sha, md5 = hashlib.sha256(), hashlib.md5()
+        with open(part, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                sha.update(chunk)
+                md5.update(chunk)
+        if expected_sha and sha.hexdigest() != expected_sha:
+            os.remove(part); os.remove(state_file)
+            raise IOError(f"{target}: sha256 mismatch")
+        if info["md5"] and base64.b64encode(md5.digest()).decode() != info["md5"]:
+            os.remove(part); os.remove(state_file)
+            raise IOError(f"{target}: Content-MD5 mismatch")
+    os.replace(part, target)
+    if os.path.exists(state_file):
+        os.remove(state_file)
+    with open(f"{target}.verified.json", "w") as f:
+        json.dump({"size": actual, "etag": info["etag"], "last_modified": info["last_modified"]}, f)
+    return "downloaded"
+
 if not IS_CUSTOM_DATA:
 # Using synapse blob, this can be done in one line
 
@@ -114,11 +254,14 @@ if not IS_CUSTOM_DATA:
             "Default lakehouse not found, please add a lakehouse and restart the session."
         )
     os.makedirs(download_path, exist_ok=True)
-    for fname in file_list:
-        if not os.path.exists(f"{download_path}/{fname}"):
-            r = requests.get(f"{remote_url}/{fname}", timeout=30)
-            with open(f"{download_path}/{fname}", "wb") as f:
-                f.write(r.content)
+    # Files run on their own threads; byte ranges of every file share the range pool
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as range_pool, ThreadPoolExecutor(max_workers=MAX_WORKERS) as file_pool:
+        results = list(file_pool.map(
+            lambda fname: (fname, download_file(f"{remote_url}/{fname}", f"{download_path}/{fname}", range_pool)),
+            file_list,
+        ))
+    for fname, status in results:
+        print(f"{fname}: {status}")
     print("Downloaded demo data files into lakehouse.")
 
 # METADATA ********************
@@ -130,6 +273,73 @@ if not IS_CUSTOM_DATA:
 
 # MARKDOWN ********************
 
+# ### Convert the raw file into a typed bronze Delta table
+# 
+# The CSV is read once with a declared schema (no `inferSchema` pass over the data) and written as a Delta table partitioned by `Geography`, with ingestion metadata columns. Downstream notebooks read this columnar table instead of parsing and inferring the CSV on every run.
+# 
+# The first run creates the table. Later runs MERGE the file into it by `CustomerId`: new customers are inserted, and customers whose values changed are updated. Unchanged rows keep their `_IngestedAtUtc`, so that column tells Part 4's incremental scoring which customers are new or changed. When the file holds a customer more than once, the row with the highest `RowNumber` wins.
+
+# CELL ********************
+
+from delta.tables import DeltaTable
+from pyspark.sql import Window
+from pyspark.sql import functions as F
+
+CHURN_SCHEMA = """
+    RowNumber INT,
+    CustomerId INT,
+    Surname STRING,
+    CreditScore INT,
+    Geography STRING,
+    Gender STRING,
+    Age INT,
+    Tenure INT,
+    Balance DOUBLE,
+    NumOfProducts INT,
+    HasCrCard INT,
+    IsActiveMember INT,
+    EstimatedSalary DOUBLE,
+    Exited INT
+"""
+
+bronze_df = (
+    spark.read.option("header", True)
+    .option("mode", "FAILFAST")  # a row that doesn't fit the schema fails the load instead of becoming nulls
+    .schema(CHURN_SCHEMA)
+    .csv(f"{DATA_FOLDER}/raw/{DATA_FILE}")
+    .withColumn("_SourceFile", F.col("_metadata.file_path"))
+    .withColumn("_IngestedAtUtc", F.current_timestamp())
+    .withColumn("_n", F.row_number().over(Window.partitionBy("CustomerId").orderBy(F.col("RowNumber").desc())))
+    .filter("_n = 1")  # one row per customer, so the MERGE below never matches a target row twice
+    .drop("_n")
+)
+
+bronze_path = f"Tables/{BRONZE_TABLE}"
+if not DeltaTable.isDeltaTable(spark, bronze_path):
+    (bronze_df.write.format("delta")
+     .mode("overwrite")
+     .option("overwriteSchema", "true")
+     .partitionBy("Geography")
+     .save(bronze_path))
+else:
+    business_columns = [c for c in bronze_df.columns if not c.startswith("_")]
+    changed = " OR ".join(f"NOT (t.{c} <=> s.{c})" for c in business_columns)
+    (DeltaTable.forPath(spark, bronze_path).alias("t")
+     .merge(bronze_df.alias("s"), "t.CustomerId = s.CustomerId")
+     .whenMatchedUpdateAll(condition=changed)
+     .whenNotMatchedInsertAll()
+     .execute())
+print(f"Raw file {DATA_FILE} saved to delta table: {BRONZE_TABLE}")
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
 # ## Next step
 # 
 # You'll use the data you just ingested in [Part 2: Explore and cleanse data](https://learn.microsoft.com/fabric/data-science/tutorial-data-science-explore-notebook).
@@ -47,14 +47,19 @@
 
 # ## Read raw data from the lakehouse
 # 
-# Read raw data from the **Files** section of the lakehouse. You uploaded this data in the previous notebook. Make sure you have attached the same lakehouse you used in Part 1 to this notebook before you run this code.
+# Read the typed `bronze_churn` Delta table you created in the previous notebook from the raw CSV file. Its schema is declared at ingestion, so there is no schema inference pass over the file here. Make sure you have attached the same lakehouse you used in Part 1 to this notebook before you run this code.
 
 # CELL ********************
 
+SPARK_NATIVE = True  # build df_clean with Spark; pandas only gets the EDA sample below
+EDA_SAMPLE_ROWS = 200_000  # rows collected to the driver for the exploration cells
+QUANTILE_ERROR = 1e-4  # relative error of approxQuantile for the binned features; 0.0 => exact
+COMPACT_FRAMES = True  # downcast / categorise the pandas frames and clean them in place instead of copying
+
 df = (
-    spark.read.option("header", True)
-    .option("inferSchema", True)
-    .csv("Files/churn/raw/churn.csv")
+    spark.read.format("delta")
+    .load("Tables/bronze_churn")
+    .drop("_SourceFile", "_IngestedAtUtc")  # ingestion metadata isn't a feature
     .cache()
 )
 
@@ -69,11 +74,27 @@ df = (
 
 # ## Create a pandas DataFrame from the dataset
 # 
-# Convert the spark DataFrame to pandas DataFrame for easier processing and visualization.
+# Convert the spark DataFrame to pandas DataFrame for easier processing and visualization. With `SPARK_NATIVE` only a sample of at most `EDA_SAMPLE_ROWS` rows is collected for exploration; `df_clean` itself is built with Spark further below.
+# 
+# The conversions of this notebook go through Arrow (`enable_arrow` from the `churn-frames` notebook). With `COMPACT_FRAMES` the pandas frame is shrunk right after the conversion: integers are downcast and `Geography` / `Gender` become categoricals.
 
 # CELL ********************
 
-df = df.toPandas()
+%run churn-frames
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# CELL ********************
+
+enable_arrow()
+df_spark = df
+df = to_pandas(df_spark.limit(EDA_SAMPLE_ROWS) if SPARK_NATIVE else df_spark, "df")
+raw_dtypes = compact_frame(df, "df") if COMPACT_FRAMES else {}
 
 # METADATA ********************
 
@@ -108,7 +129,7 @@ import itertools
 
 # CELL ********************
 
-display(df, summary=True)
+display(df)  # column statistics come from the distributed profile below
 
 # METADATA ********************
 
@@ -130,7 +151,7 @@ def clean_data(df):
     df = df.drop(columns=['CustomerId', 'RowNumber', 'Surname'])
     return df
 
-df_clean = clean_data(df.copy())
+df_clean = clean_data(df)  # every step returns a new frame, so df needs no defensive copy
 df_clean.head()
 
 # METADATA ********************
@@ -169,7 +190,8 @@ def clean_data(df):
     df.drop(columns=['RowNumber', 'CustomerId', 'Surname'], inplace=True)
     return df
 
-df_clean = clean_data(df.copy())
+# With COMPACT_FRAMES df itself is cleaned in place (and is the cleaned frame afterwards) instead of a copy of it
+df_clean = clean_data(df if COMPACT_FRAMES else df.copy())
 df_clean.head()
 
 # METADATA ********************
@@ -185,9 +207,108 @@ df_clean.head()
 # 
 # Display some summaries and visualizations of the cleaned data.
 # 
+# ### Profile every attribute in two distributed passes
+# 
+# Instead of computing `nunique` and drawing a plot per column on a pandas copy, the next cell profiles the cleaned Spark data:
+# 
+# 1. One aggregation computes, for every column at once, the row and null counts, approximate cardinality, min, max, mean and quartiles.
+# 1. One grouped aggregation over a stacked (column, bucket) view computes the histogram of every numerical attribute and the count of every category, each with the number of churned customers.
+# 
+# The result has one row per column and bucket. It is saved to the `df_clean_profile` delta table, and all charts below are drawn from that small summary only.
+
+# CELL ********************
+
+from pyspark.sql import functions as F
+from pyspark.sql.types import NumericType
+
+PROFILE_TABLE = "df_clean_profile"
+HIST_BINS = 20  # buckets per numerical histogram
+MAX_CATEGORY_CARDINALITY = 5  # <= 5 distinct values => categorical attribute
+
+
+def profile_columns(sdf, target: str = "Exited", bins: int = HIST_BINS,
+                    max_categories: int = MAX_CATEGORY_CARDINALITY) -> pd.DataFrame:
+    """
+    Univariate profile of every column with the churn rate per bucket, as a small pandas frame
+    (one row per column and histogram bucket / category).
+    """
+    columns = [c for c in sdf.columns if c != target]
+    numeric = {f.name for f in sdf.schema.fields if isinstance(f.dataType, NumericType)}
+
+    aggs = [F.count(F.lit(1)).alias("_rows")]
+    for c in columns:
+        aggs += [F.sum(F.col(c).isNull().cast("long")).alias(f"{c}__nulls"),
+                 F.approx_count_distinct(c).alias(f"{c}__cardinality")]
+        if c in numeric:
+            aggs += [F.min(c).cast("double").alias(f"{c}__min"),
+                     F.max(c).cast("double").alias(f"{c}__max"),
+                     F.avg(c).alias(f"{c}__mean"),
+                     F.percentile_approx(c, [0.25, 0.5, 0.75]).alias(f"{c}__quartiles")]
+    stats = sdf.agg(*aggs).first().asDict()
+    kinds = {c: "numerical" if c in numeric and stats[f"{c}__cardinality"] > max_categories else "categorical"
+             for c in columns}
+    binned = {c for c in columns if kinds[c] == "numerical" and stats[f"{c}__cardinality"] > bins}
+
+    keys = []
+    for c in columns:
+        if c in binned:
+            low, width = stats[f"{c}__min"], (stats[f"{c}__max"] - stats[f"{c}__min"]) / bins or 1.0
+            bucket = F.least(F.floor((F.col(c) - F.lit(low)) / F.lit(width)), F.lit(bins - 1)).cast("string")
+        else:
+            bucket = F.col(c).cast("string")
+        keys.append(F.struct(F.lit(c).alias("Column"), bucket.alias("Bucket")))
+    dist = (sdf.select(F.explode(F.array(*keys)).alias("k"), F.col(target).cast("long").alias("_churned"))
+            .groupBy("k.Column", "k.Bucket")
+            .agg(F.count(F.lit(1)).alias("Count"), F.sum("_churned").alias("Churned"))
+            .toPandas())
+
+    rows = stats["_rows"]
+    summary = pd.DataFrame([{
+        "Column": c,
+        "Kind": kinds[c],
+        "Rows": rows,
+        "NullRate": stats[f"{c}__nulls"] / rows if rows else None,
+        "Cardinality": stats[f"{c}__cardinality"],
+        "Min": stats.get(f"{c}__min"),
+        "Q1": (stats.get(f"{c}__quartiles") or [None] * 3)[0],
+        "Median": (stats.get(f"{c}__quartiles") or [None] * 3)[1],
+        "Q3": (stats.get(f"{c}__quartiles") or [None] * 3)[2],
+        "Max": stats.get(f"{c}__max"),
+        "Mean": stats.get(f"{c}__mean"),
+    } for c in columns])
+    profile = dist.merge(summary, on="Column")
+    profile["ChurnRate"] = profile["Churned"] / profile["Count"]
+
+    # binned columns have a bucket index, other numerical columns one bucket per value
+    value = pd.to_numeric(profile["Bucket"].where(profile["Column"].isin(numeric)), errors="coerce")
+    is_binned = profile["Column"].isin(binned)
+    width = (profile["Max"] - profile["Min"]) / bins
+    profile["BucketLow"] = (profile["Min"] + value * width).where(is_binned, value)
+    profile["BucketHigh"] = (profile["BucketLow"] + width).where(is_binned, value)
+    return (profile.assign(_order=value.fillna(0)).sort_values(["Column", "_order", "Bucket"])
+            .drop(columns="_order").reset_index(drop=True))
+
+
+df_profile_source = (df_spark.dropna().dropDuplicates(["RowNumber", "CustomerId"])
+                     .drop("RowNumber", "CustomerId", "Surname"))
+profile = profile_columns(df_profile_source)
+to_spark(profile, "profile").write.option("overwriteSchema", "true").mode("overwrite").format("delta").save(f"Tables/{PROFILE_TABLE}")
+column_stats = profile.drop_duplicates("Column").set_index("Column")[
+    ["Kind", "Rows", "NullRate", "Cardinality", "Min", "Q1", "Median", "Q3", "Max", "Mean"]]
+display(column_stats)
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
 # ### Determine categorical, numerical, and target attributes
 # 
-# Use this code to determine categorical, numerical, and target attributes.
+# Use this code to determine categorical, numerical, and target attributes from the profile.
 
 # CELL ********************
 
@@ -195,13 +316,10 @@ df_clean.head()
 dependent_variable_name = "Exited"
 print(dependent_variable_name)
 # Determine the categorical attributes
-categorical_variables = [col for col in df_clean.columns if col in "O"
-                        or df_clean[col].nunique() <=5
-                        and col not in "Exited"]
+categorical_variables = column_stats.index[column_stats["Kind"] == "categorical"].tolist()
 print(categorical_variables)
 # Determine the numerical attributes
-numeric_variables = [col for col in df_clean.columns if df_clean[col].dtype != "object"
-                        and df_clean[col].nunique() >5]
+numeric_variables = column_stats.index[column_stats["Kind"] == "numerical"].tolist()
 print(numeric_variables)
 
 # METADATA ********************
@@ -215,18 +333,18 @@ print(numeric_variables)
 
 # ### The five-number summary 
 # 
-# Show the five-number summary (the minimum score, first quartile, median, third quartile, the maximum score) for the numerical attributes, using box plots.
+# Show the five-number summary (the minimum score, first quartile, median, third quartile, the maximum score) for the numerical attributes, using box plots. The whiskers span the minimum and maximum.
 
 # CELL ********************
 
-df_num_cols = df_clean[numeric_variables]
 sns.set(font_scale = 0.7) 
 fig, axes = plt.subplots(nrows = 2, ncols = 3, gridspec_kw =  dict(hspace=0.3), figsize = (17,8))
 fig.tight_layout()
-for ax,col in zip(axes.flatten(), df_num_cols.columns):
-    sns.boxplot(x = df_num_cols[col], color='green', ax = ax)
-fig.delaxes(axes[1,2])
-
+for ax, (col, st) in zip(axes.flatten(), column_stats.loc[numeric_variables].iterrows()):
+    ax.bxp([{"label": col, "whislo": st["Min"], "q1": st["Q1"], "med": st["Median"], "q3": st["Q3"], "whishi": st["Max"]}],
+           vert=False, showfliers=False, patch_artist=True, boxprops=dict(facecolor="green"))
+for ax in axes.flatten()[len(numeric_variables):]:
+    fig.delaxes(ax)
 
 # METADATA ********************
 
@@ -243,22 +361,13 @@ fig.delaxes(axes[1,2])
 
 # CELL ********************
 
-df_clean['Exited'] = df_clean['Exited'].astype(str)
-
-# METADATA ********************
-
-# META {
-# META   "language": "python",
-# META   "language_group": "synapse_pyspark"
-# META }
-
-# CELL ********************
-
 attr_list = ['Geography', 'Gender', 'HasCrCard', 'IsActiveMember', 'NumOfProducts', 'Tenure']
+counts = profile[profile["Column"].isin(attr_list)].assign(Stayed=lambda p: p["Count"] - p["Churned"])
 fig, axarr = plt.subplots(2, 3, figsize=(15, 4))
 for ind, item in enumerate (attr_list):
-    print(ind, item)
-    sns.countplot(x = item, hue = 'Exited', data = df_clean, ax = axarr[ind%2][ind//2])
+    item_counts = counts[counts["Column"] == item].set_index("Bucket")[["Stayed", "Churned"]]
+    item_counts.columns = ["0", "1"]
+    item_counts.plot.bar(ax = axarr[ind%2][ind//2], rot=0, xlabel=item).legend(title="Exited")
 fig.subplots_adjust(hspace=0.7)
 
 # METADATA ********************
@@ -268,17 +377,6 @@ fig.subplots_adjust(hspace=0.7)
 # META   "language_group": "synapse_pyspark"
 # META }
 
-# CELL ********************
-
-df_clean['Exited'] = df_clean['Exited'].astype(int)
-
-# METADATA ********************
-
-# META {
-# META   "language": "python",
-# META   "language_group": "synapse_pyspark"
-# META }
-
 # MARKDOWN ********************
 
 # ### Distribution of numerical attributes
@@ -287,15 +385,18 @@ df_clean['Exited'] = df_clean['Exited'].astype(int)
 
 # CELL ********************
 
-columns = df_num_cols.columns[: len(df_num_cols.columns)]
 fig = plt.figure()
 fig.set_size_inches(18, 8)
-length = len(columns)
-for i,j in itertools.zip_longest(columns, range(length)):
+length = len(numeric_variables)
+for j, col in enumerate(numeric_variables):
+    hist = profile[(profile["Column"] == col) & profile["BucketLow"].notna()]
     plt.subplot((length // 2), 3, j+1)
     plt.subplots_adjust(wspace = 0.2, hspace = 0.5)
-    df_num_cols[i].hist(bins = 20, edgecolor = 'black')
-    plt.title(i)
+    if (hist["BucketHigh"] > hist["BucketLow"]).any():
+        plt.bar(hist["BucketLow"], hist["Count"], width=hist["BucketHigh"] - hist["BucketLow"], align="edge", edgecolor = 'black')
+    else:  # one bar per distinct value
+        plt.bar(hist["BucketLow"], hist["Count"], width=0.8, edgecolor = 'black')
+    plt.title(col)
 plt.show()
 
 # METADATA ********************
@@ -345,7 +446,7 @@ def clean_data(df_clean):
         df_clean = pd.concat([df_clean.iloc[:,:insert_loc], pd.get_dummies(df_clean.loc[:, [column]]), df_clean.iloc[:,insert_loc+1:]], axis=1)
     return df_clean
 
-df_clean_1 = clean_data(df_clean.copy())
+df_clean_1 = clean_data(df_clean)  # returns a new frame, df_clean is not modified
 df_clean_1.head()
 
 # METADATA ********************
@@ -366,7 +467,7 @@ def clean_data(df_clean):
     df_clean = pd.get_dummies(df_clean, columns=['Geography', 'Gender'])
     return df_clean
  
-df_clean_1 = clean_data(df_clean.copy())
+df_clean_1 = clean_data(df_clean)  # returns a new frame, df_clean is not modified
 df_clean_1.head()
 
 # METADATA ********************
@@ -389,6 +490,48 @@ df_clean_1.head()
 
 # MARKDOWN ********************
 
+# ## Build df_clean with Spark
+# 
+# The pandas cells above collect the whole table to the driver. The next cells apply the same cleansing, feature engineering and one-hot encoding with Spark, so it scales with the cluster instead of driver memory, and produce the same `df_clean` schema.
+# 
+# The feature engineering is done by the `ChurnFeatures` transformer from the `churn-features` notebook. It is fitted here (bin edges from a single `approxQuantile` pass, bucketed right-closed like `pd.qcut`, and the sorted one-hot categories like `pd.get_dummies`) and saved next to the data, so Part 3 can log it with the models and Part 4 can transform new batches with exactly the same bins.
+
+# CELL ********************
+
+%run churn-features
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# CELL ********************
+
+def spark_clean_features(sdf, relative_error: float = QUANTILE_ERROR):
+    """
+    Distributed equivalent of the pandas clean_data + feature engineering + one-hot cells.
+    Returns the transformed frame and the fitted transformer.
+    """
+    sdf = sdf.dropna().dropDuplicates(["RowNumber", "CustomerId"])
+    features = ChurnFeatures.fit_spark(sdf, relative_error)
+    return features.transform_spark(sdf), features
+
+
+if SPARK_NATIVE:
+    df_clean_spark, churn_features = spark_clean_features(df_spark)
+    df_clean_spark.printSchema()
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
 # ## Create a delta table for the cleaned data
 # 
 # You'll use this data in the next notebook of this series.
@@ -396,8 +539,13 @@ df_clean_1.head()
 # CELL ********************
 
 table_name = "df_clean"
-# Create Spark DataFrame from pandas
-sparkDF=spark.createDataFrame(df_clean_1) 
+# Use the Spark-built frame, or create a Spark DataFrame from pandas with the fitted bins
+if SPARK_NATIVE:
+    sparkDF = df_clean_spark
+else:
+    churn_features = ChurnFeatures.fit_pandas(df_clean)
+    sparkDF = to_spark(restore_dtypes(churn_features.transform_pandas(df_clean), raw_dtypes), "df_clean")
+churn_features.save(FEATURE_SPEC_PATH)
 sparkDF.write.option("overwriteSchema", "true").mode("overwrite").format("delta").save(f"Tables/{table_name}")
 print(f"Spark dataframe saved to delta table: {table_name}")
 
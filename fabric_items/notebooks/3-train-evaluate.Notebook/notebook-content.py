@@ -16,6 +16,10 @@
 # META           "id": "c6ef34a4-097d-4af6-9994-cfb85664adf9"
 # META         }
 # META       ]
+# META     },
+# META     "environment": {
+# META       "environmentId": "85df38f6-61fe-4f3a-a591-e71b0ead81b6",
+# META       "workspaceId": "00000000-0000-0000-0000-000000000000"
 # META     }
 # META   }
 # META }
@@ -41,14 +45,13 @@
 # 
 # For this notebook, you'll install imbalanced-learn (imported as `imblearn`) using `%pip install`. Imbalanced-learn is a library for Synthetic Minority Oversampling Technique (SMOTE) which is used when dealing with imbalanced datasets. The PySpark kernel will be restarted after `%pip install`, so you'll need to install the library before you run any other cells. 
 # 
-# You'll access SMOTE using the `imblearn` library. Install it now using the in-line installation capabilities (e.g., `%pip`, `%conda`).
+# You'll access SMOTE using the `imblearn` library. This notebook is attached to the `churn_env` environment, which pins imbalanced-learn, scikit-learn and mlflow, so the session starts with them already installed. The next cell only falls back to `%pip install` for a library that is missing or at a different version (for example when the notebook is detached from the environment).
 # 
 
 
 # CELL ********************
 
-# Install imblearn for SMOTE using pip
-%pip install imblearn
+%run churn-frames
 
 # METADATA ********************
 
@@ -59,18 +62,16 @@
 
 # CELL ********************
 
-%pip install scikit-learn==1.6.1
+# Only install what the attached churn_env environment doesn't already provide at the pinned version
+# (missing_requirements comes from churn-frames, which runs again later because %pip install restarts Python)
+REQUIRED = {"imbalanced-learn": "0.13.0", "scikit-learn": "1.6.1", "mlflow": "2.12.2"}
 
-# METADATA ********************
-
-# META {
-# META   "language": "python",
-# META   "language_group": "synapse_pyspark"
-# META }
-
-# CELL ********************
-
-%pip install "mlflow==2.12.2"
+missing = missing_requirements(REQUIRED)
+if missing:
+    print(f"📦 Installing {', '.join(missing)}")
+    get_ipython().run_line_magic("pip", f"install -q {' '.join(missing)}")
+else:
+    print("✅ Required libraries already available from the environment")
 
 # METADATA ********************
 
@@ -92,12 +93,32 @@
 # ## Load the data
 # 
 # Load the delta table from the lakehouse in order to read the cleaned data you created in the previous notebook.
+# 
+# The conversions between Spark and pandas go through Arrow (`enable_arrow` from the `churn-frames` notebook). With `COMPACT_FRAMES` the pandas frame is shrunk right after loading. The frames that are written to Delta or used to fit the models get their original dtypes back, so the `df_test` schema and the logged model signatures don't change.
+
+# CELL ********************
+
+%run churn-frames
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
 
 # CELL ********************
 
+import json
 import pandas as pd
 SEED = 12345
-df_clean = spark.read.format("delta").load("Tables/df_clean").toPandas()
+COMPACT_FRAMES = True  # downcast the pandas frames to fit larger extracts in the driver
+enable_arrow()
+df_clean = to_pandas(spark.read.format("delta").load("Tables/df_clean"), "df_clean")
+clean_dtypes = compact_frame(df_clean, "df_clean") if COMPACT_FRAMES else {}
+# Feature transformer fitted in Part 2; logged with every model so scoring uses the same bins
+with open("/lakehouse/default/Files/churn/features/churn_features.json") as f:
+    feature_spec = json.load(f)
 
 # METADATA ********************
 
@@ -133,12 +154,50 @@ EXPERIMENT_NAME = "bank-churn-experiment-SBM-test"  # MLflow experiment name
 
 # MARKDOWN ********************
 
-# ### Set experiment and autologging specifications
+# ### Set experiment and logging specifications
+# 
+# `MLFLOW_LOGGING` picks how much the training runs send to MLflow:
+# 
+# - `minimal` – params and metrics only, one batched call per run; only the models that get registered upload an artifact
+# - `standard` – as minimal, plus the model artifact of every candidate, uploaded once the whole sweep is done
+# - `full` – as standard, plus every estimator parameter (not only the tuned ones) and training-set metrics, and every candidate is registered with an input example
+# 
+# In `minimal` and `standard` only the best model of the leaderboard is registered, together with the models in `REGISTER_ALWAYS` that Part 4 scores.
+# 
+# The candidates are fitted in worker processes, where MLflow autologging on the driver can't see them, so autologging is switched off and `full` logs the same information explicitly from the worker results.
 
 # CELL ********************
 
-mlflow.set_experiment(EXPERIMENT_NAME)
-mlflow.autolog(exclusive=False)
+import time
+from mlflow.entities import Metric, Param
+from mlflow.tracking import MlflowClient
+
+MLFLOW_LOGGING = "standard"  # minimal | standard | full
+LOGGING_PROFILES = {
+    "minimal": {"all_params": False, "model_artifacts": "registered", "register": "winner", "input_example": False},
+    "standard": {"all_params": False, "model_artifacts": "all", "register": "winner", "input_example": False},
+    "full": {"all_params": True, "model_artifacts": "all", "register": "all", "input_example": True},
+}
+REGISTER_ALWAYS = {"lgbm_sm"}  # registered in every profile, Part 4 scores it
+
+logging_profile = LOGGING_PROFILES[MLFLOW_LOGGING]
+experiment = mlflow.set_experiment(EXPERIMENT_NAME)
+mlflow.autolog(disable=True)  # fits run in worker processes, autologging on the driver would capture nothing
+mlflow_client = MlflowClient()
+
+
+def log_run_batch(run_name: str, params: dict, metrics: dict, parent_run_id: str = None) -> str:
+    """
+    Create a finished run with all its params and metrics in a single log_batch call. Returns the run id.
+    """
+    tags = {"mlflow.parentRunId": parent_run_id} if parent_run_id else None
+    run_id = mlflow_client.create_run(experiment.experiment_id, tags=tags, run_name=run_name).info.run_id
+    timestamp = int(time.time() * 1000)
+    mlflow_client.log_batch(run_id,
+                            metrics=[Metric(k, float(v), timestamp, 0) for k, v in metrics.items()],
+                            params=[Param(k, str(v)) for k, v in params.items()])
+    mlflow_client.set_terminated(run_id)
+    return run_id
 
 # METADATA ********************
 
@@ -176,8 +235,8 @@ from sklearn.metrics import accuracy_score, f1_score, precision_score, confusion
 
 # CELL ********************
 
-y = df_clean["Exited"]
-X = df_clean.drop("Exited",axis=1)
+y = df_clean.pop("Exited") # Moves the target out in place, so the features aren't copied
+X = df_clean
 # Split the dataset to 60%, 20%, 20% for training, validation, and test datasets
 # Train-Test Separation
 X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.20, random_state=SEED)
@@ -202,7 +261,7 @@ X_train, X_val, y_train, y_val = train_test_split(X_train, y_train, test_size=0.
 
 table_name = "df_test"
 # Create PySpark DataFrame from Pandas
-df_test=spark.createDataFrame(X_test)
+df_test=to_spark(restore_dtypes(X_test, clean_dtypes), "df_test")
 df_test.write.mode("overwrite").format("delta").save(f"Tables/{table_name}")
 print(f"Spark test DataFrame saved to delta table: {table_name}")
 
@@ -223,15 +282,69 @@ print(f"Spark test DataFrame saved to delta table: {table_name}")
 # > [!TIP]
 # >
 # > Note that SMOTE should only be applied to the training dataset. You must leave the test dataset in its original imbalanced distribution in order to get a valid approximation of how the machine learning model will perform on the original data, which is representing the situation in production.
+# 
+# The resampled training set is cached as a parquet file under `Files/churn/smote_cache`, keyed by the `df_clean` table version, a hash of the training rows and the SMOTE settings. Reruns on unchanged data skip SMOTE entirely. Training sets larger than `SMOTE_CHUNK_ROWS` are resampled in parallel chunks, with nearest neighbours searched within each chunk.
 
 
 # CELL ********************
 
+import hashlib
+import os
 from collections import Counter
-from imblearn.over_sampling import SMOTE
 
-sm = SMOTE(random_state=SEED)
-X_res, y_res = sm.fit_resample(X_train, y_train)
+import imblearn
+import numpy as np
+from delta.tables import DeltaTable
+from imblearn.over_sampling import SMOTE
+from joblib import Parallel, delayed
+
+SMOTE_PARAMS = {"random_state": SEED, "k_neighbors": 5}
+SMOTE_CACHE_DIR = "/lakehouse/default/Files/churn/smote_cache" # resampled training sets, one parquet file per key
+SMOTE_CHUNK_ROWS = 1_000_000 # larger training sets are resampled in random chunks, neighbours searched within a chunk
+
+
+def smote_cache_key(X, y) -> str:
+    """
+    Fingerprint of everything the resampled training set depends on: the df_clean version, the split and the SMOTE settings.
+    """
+    key = {
+        "df_clean_version": DeltaTable.forPath(spark, "Tables/df_clean").history(1).first()["version"],
+        "split_seed": SEED,
+        "train_rows": hashlib.sha256(pd.util.hash_pandas_object(pd.concat([X, y], axis=1), index=False).values).hexdigest(),
+        "smote": SMOTE_PARAMS,
+        "chunk_rows": SMOTE_CHUNK_ROWS,
+        "imblearn": imblearn.__version__,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def smote_resample(X, y, params: dict = SMOTE_PARAMS, chunk_rows: int = SMOTE_CHUNK_ROWS):
+    """
+    SMOTE over the whole training set, or over random chunks of at most chunk_rows rows in parallel for large inputs.
+    """
+    if len(X) <= chunk_rows:
+        return SMOTE(**params).fit_resample(X, y)
+    order = np.random.default_rng(params.get("random_state")).permutation(len(X))
+    chunks = np.array_split(order, -(-len(X) // chunk_rows))
+    parts = Parallel(n_jobs=-1, backend="loky")(
+        delayed(SMOTE(**params).fit_resample)(X.iloc[idx], y.iloc[idx]) for idx in chunks)
+    return (pd.concat([p[0] for p in parts], ignore_index=True),
+            pd.concat([p[1] for p in parts], ignore_index=True))
+
+
+smote_path = f"{SMOTE_CACHE_DIR}/{smote_cache_key(X_train, y_train)}.parquet"
+if os.path.exists(smote_path):
+    X_res = pd.read_parquet(smote_path)
+    y_res = X_res.pop(y_train.name)
+    print(f"♻️ Resampled training set loaded from {smote_path}")
+else:
+    X_res, y_res = smote_resample(X_train, y_train)
+    X_res = restore_dtypes(X_res, clean_dtypes) # Fit on the original dtypes so the model signatures stay int64 / float64
+    os.makedirs(SMOTE_CACHE_DIR, exist_ok=True)
+    pd.concat([X_res, y_res], axis=1).to_parquet(f"{smote_path}.partial", index=False)
+    os.replace(f"{smote_path}.partial", smote_path)
+    print(f"✅ Resampled training set cached at {smote_path}")
+print(f"Training rows by class: {dict(Counter(y_res))}")
 new_train = pd.concat([X_res, y_res], axis=1)
 
 # METADATA ********************
@@ -244,25 +357,33 @@ new_train = pd.concat([X_res, y_res], axis=1)
 # MARKDOWN ********************
 
 # ### Model Training
+# 
+# The candidate models are described as data: a name (also the registered model name), an estimator and its hyperparameters. `train_candidates` fits all of them at the same time in separate worker processes, splitting the driver's cores between them, so the wall-clock time is roughly that of the slowest model instead of the sum. Each fitted model is then scored on the validation set and logged to the experiment as its own run, and the candidates are returned as a leaderboard. Model artifacts are uploaded and registered at the end, as `MLFLOW_LOGGING` asks.
 
 # MARKDOWN ********************
 
-# * Train the model using Random Forest with maximum depth of 4 and 4 features
+# * Random Forest with maximum depth of 4 and 4 features
+# * Random Forest with maximum depth of 8 and 6 features
+# * LightGBM
 
 # CELL ********************
 
-mlflow.sklearn.autolog(registered_model_name='rfc1_sm') # Register the trained model with autologging
-rfc1_sm = RandomForestClassifier(max_depth=4, max_features=4, min_samples_split=3, random_state=1) # Pass hyperparameters
-with mlflow.start_run(run_name="rfc1_sm") as run:
-    rfc1_sm_run_id = run.info.run_id # Capture run_id for model prediction later
-    print("run_id: {}; status: {}".format(rfc1_sm_run_id, run.info.status))
-    # rfc1.fit(X_train,y_train) # Imbalanaced training data
-    rfc1_sm.fit(X_res, y_res.ravel()) # Balanced training data
-    rfc1_sm.score(X_val, y_val)
-    y_pred = rfc1_sm.predict(X_val)
-    cr_rfc1_sm = classification_report(y_val, y_pred)
-    cm_rfc1_sm = confusion_matrix(y_val, y_pred)
-    roc_auc_rfc1_sm = roc_auc_score(y_res, rfc1_sm.predict_proba(X_res)[:, 1])
+from mlflow.models import infer_signature
+
+ESTIMATORS = {  # estimator name -> (class, MLflow flavor used to log it)
+    "RandomForestClassifier": (RandomForestClassifier, mlflow.sklearn),
+    "LGBMClassifier": (LGBMClassifier, mlflow.lightgbm),
+}
+
+CANDIDATES = [
+    {"name": "rfc1_sm", "estimator": "RandomForestClassifier",
+     "params": {"max_depth": 4, "max_features": 4, "min_samples_split": 3, "random_state": 1}},
+    {"name": "rfc2_sm", "estimator": "RandomForestClassifier",
+     "params": {"max_depth": 8, "max_features": 6, "min_samples_split": 3, "random_state": 1}},
+    {"name": "lgbm_sm", "estimator": "LGBMClassifier",
+     "params": {"learning_rate": 0.07, "max_delta_step": 2, "n_estimators": 100, "max_depth": 10,
+                "eval_metric": "logloss", "objective": "binary", "random_state": 42}},
+]
 
 # METADATA ********************
 
@@ -273,22 +394,198 @@ with mlflow.start_run(run_name="rfc1_sm") as run:
 
 # MARKDOWN ********************
 
-# * Train the model using Random Forest with maximum depth of 8 and 6 features
+# ### Evaluation engine
+# 
+# `evaluate_models` takes the validation labels and a matrix of predicted probabilities, one column per model, and computes every metric for all models at once with NumPy: ROC AUC (exact, from ranks), average precision (exact, as scikit-learn's `average_precision_score`), Brier score, log loss, the confusion counts, precision, recall and F1 over a sweep of `THRESHOLDS`, and a calibration table. The summary's confusion counts use probability > `DEFAULT_THRESHOLD`, like `predict`, while the sweep counts probability >= threshold. It returns a summary with one row per model and a curves table with one row per model and threshold / calibration bin, which `save_evaluation` appends to the `model_evaluation` and `model_evaluation_curves` delta tables.
 
 # CELL ********************
 
-mlflow.sklearn.autolog(registered_model_name='rfc2_sm') # Register the trained model with autologging
-rfc2_sm = RandomForestClassifier(max_depth=8, max_features=6, min_samples_split=3, random_state=1) # Pass hyperparameters
-with mlflow.start_run(run_name="rfc2_sm") as run:
-    rfc2_sm_run_id = run.info.run_id # Capture run_id for model prediction later
-    print("run_id: {}; status: {}".format(rfc2_sm_run_id, run.info.status))
-    # rfc2.fit(X_train,y_train) # Imbalanced training data
-    rfc2_sm.fit(X_res, y_res.ravel()) # Balanced training data
-    rfc2_sm.score(X_val, y_val)
-    y_pred = rfc2_sm.predict(X_val)
-    cr_rfc2_sm = classification_report(y_val, y_pred)
-    cm_rfc2_sm = confusion_matrix(y_val, y_pred)
-    roc_auc_rfc2_sm = roc_auc_score(y_res, rfc2_sm.predict_proba(X_res)[:, 1])
+import numpy as np
+from scipy.stats import rankdata
+
+THRESHOLDS = np.round(np.linspace(0, 1, 101), 2) # predicted churn when probability >= threshold
+DEFAULT_THRESHOLD = 0.5 # summary counts use probability > threshold, like predict
+CALIBRATION_BINS = 10
+EVALUATION_TABLE = "model_evaluation"
+EVALUATION_CURVES_TABLE = "model_evaluation_curves"
+
+
+def evaluate_models(y_true, proba, names: list, thresholds=THRESHOLDS, calibration_bins: int = CALIBRATION_BINS):
+    """
+    Metrics of N models from an (n_samples, N) probability matrix in one vectorised pass. Returns (summary, curves).
+    """
+    y = np.asarray(y_true, dtype=float)
+    p = np.asarray(proba, dtype=float).reshape(len(y), -1)
+    n, m = p.shape
+    t = len(thresholds)
+    positives, negatives = y.sum(), n - y.sum()
+    y_flat = np.repeat(y, m) # matches p.ravel(): row-major, one value per (sample, model)
+    model_of = np.tile(np.arange(m), n)
+
+    # positives / rows per (model, highest threshold <= probability), then counts at or above every threshold
+    key = model_of * t + np.searchsorted(thresholds, p.ravel(), side="right") - 1
+    pos = np.bincount(key, weights=y_flat, minlength=m * t).reshape(m, t)
+    rows = np.bincount(key, minlength=m * t).reshape(m, t)
+    tp = pos[:, ::-1].cumsum(axis=1)[:, ::-1]
+    fp = rows[:, ::-1].cumsum(axis=1)[:, ::-1] - tp
+    fn, tn = positives - tp, negatives - fp
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 1.0)
+        recall = tp / positives
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    fpr = fp / negatives
+
+    ranks = rankdata(p, axis=0) # Mann-Whitney U, ties averaged
+    roc_auc = (ranks[y == 1].sum(axis=0) - positives * (positives + 1) / 2) / (positives * negatives)
+    # exact average precision: every positive weighted by the precision at the end of its tie group
+    order = np.argsort(-p, axis=0, kind="stable")
+    p_sorted, y_sorted = np.take_along_axis(p, order, axis=0), y[order]
+    seen = np.arange(1, n + 1)[:, None]
+    group_end = np.where(np.vstack([p_sorted[1:] != p_sorted[:-1], np.ones((1, m), bool)]), seen - 1, n)
+    group_end = np.minimum.accumulate(group_end[::-1], axis=0)[::-1]
+    precision_at = np.take_along_axis(y_sorted.cumsum(axis=0) / seen, group_end, axis=0)
+    average_precision = (y_sorted * precision_at).sum(axis=0) / positives
+    brier = ((p - y[:, None]) ** 2).mean(axis=0)
+    clipped = np.clip(p, np.finfo(float).eps, 1 - np.finfo(float).eps)
+    log_loss = -(y[:, None] * np.log(clipped) + (1 - y[:, None]) * np.log(1 - clipped)).mean(axis=0)
+
+    cal_key = model_of * calibration_bins + np.minimum((p.ravel() * calibration_bins).astype(int), calibration_bins - 1)
+    cal_rows = np.bincount(cal_key, minlength=m * calibration_bins).reshape(m, -1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cal_predicted = np.bincount(cal_key, weights=p.ravel(), minlength=m * calibration_bins).reshape(m, -1) / cal_rows
+        cal_observed = np.bincount(cal_key, weights=y_flat, minlength=m * calibration_bins).reshape(m, -1) / cal_rows
+    calibration_error = np.nansum(cal_rows * np.abs(cal_predicted - cal_observed), axis=1) / n
+
+    predicted = p > DEFAULT_THRESHOLD
+    tp_d, fp_d = (predicted & (y[:, None] == 1)).sum(axis=0), (predicted & (y[:, None] == 0)).sum(axis=0)
+    fn_d, tn_d = positives - tp_d, negatives - fp_d
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision_d = np.where(tp_d + fp_d > 0, tp_d / (tp_d + fp_d), 1.0)
+        recall_d = tp_d / positives
+        f1_d = np.where(precision_d + recall_d > 0, 2 * precision_d * recall_d / (precision_d + recall_d), 0.0)
+    best = f1.argmax(axis=1)
+    summary = pd.DataFrame({
+        "Model": names, "Rows": n, "RocAuc": roc_auc, "AveragePrecision": average_precision, "Brier": brier,
+        "LogLoss": log_loss, "CalibrationError": calibration_error, "Threshold": DEFAULT_THRESHOLD,
+        "Accuracy": (tp_d + tn_d) / n, "Precision": precision_d, "Recall": recall_d, "F1": f1_d,
+        "TP": tp_d, "FP": fp_d, "TN": tn_d.astype(int), "FN": fn_d.astype(int),
+        "BestF1": f1[np.arange(m), best], "BestF1Threshold": thresholds[best],
+    })
+    sweep = pd.DataFrame({
+        "Model": np.repeat(names, t), "Kind": "threshold", "Threshold": np.tile(thresholds, m),
+        "TP": tp.ravel(), "FP": fp.ravel(), "Precision": precision.ravel(), "Recall": recall.ravel(),
+        "FPR": fpr.ravel(), "F1": f1.ravel(),
+    })
+    calibration = pd.DataFrame({
+        "Model": np.repeat(names, calibration_bins), "Kind": "calibration",
+        "Bin": np.tile(np.arange(calibration_bins), m), "Count": cal_rows.ravel(),
+        "MeanPredicted": cal_predicted.ravel(), "ObservedRate": cal_observed.ravel(),
+    })
+    return summary, pd.concat([sweep, calibration], ignore_index=True)
+
+
+def save_evaluation(summary: pd.DataFrame, curves: pd.DataFrame, dataset: str = "validation"):
+    evaluated_at = pd.Timestamp.now(tz="UTC").tz_localize(None)
+    for frame, table in [(summary, EVALUATION_TABLE), (curves, EVALUATION_CURVES_TABLE)]:
+        (to_spark(frame.assign(Dataset=dataset, EvaluatedAtUtc=evaluated_at), table)
+         .write.format("delta").mode("append").option("mergeSchema", "true").save(f"Tables/{table}"))
+
+
+def confusion_at(summary: pd.DataFrame, model: str) -> np.ndarray:
+    row = summary.set_index("Model").loc[model]
+    return np.array([[row["TN"], row["FP"]], [row["FN"], row["TP"]]])
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# CELL ********************
+
+import os
+import time
+from joblib import Parallel, delayed
+
+
+def fit_candidate(spec: dict, X, y, X_val, n_jobs: int, training_metrics: bool = False):
+    """
+    Fit one candidate and predict the validation set. Runs in a worker process, so it doesn't touch MLflow.
+    With training_metrics, also returns the metrics of the model on its own training set.
+    """
+    from sklearn.metrics import log_loss
+
+    estimator, _ = ESTIMATORS[spec["estimator"]]
+    model = estimator(**spec["params"], n_jobs=n_jobs)
+    start = time.time()
+    model.fit(X, y)
+    fit_seconds = time.time() - start
+    train = {}
+    if training_metrics:
+        proba = model.predict_proba(X)[:, 1]
+        train = {"training_roc_auc": roc_auc_score(y, proba), "training_log_loss": log_loss(y, proba),
+                 "training_accuracy": accuracy_score(y, proba > 0.5)}
+    return spec, model, fit_seconds, model.predict_proba(X_val)[:, 1], train
+
+
+VALIDATION_METRICS = {"val_accuracy": "Accuracy", "val_precision": "Precision", "val_recall": "Recall", "val_f1": "F1",
+                      "val_roc_auc": "RocAuc", "val_average_precision": "AveragePrecision", "val_brier": "Brier",
+                      "val_log_loss": "LogLoss"}
+
+
+def train_candidates(candidates: list, X, y, X_val, y_val, max_workers: int = None):
+    """
+    Fit all candidates concurrently, evaluate them together on the validation set, then log and register them.
+    Returns (leaderboard, {name: model}, (evaluation summary, evaluation curves)).
+    """
+    cores = os.cpu_count() or 1
+    max_workers = max_workers or min(len(candidates), cores)
+    start = time.time()
+    fitted = Parallel(n_jobs=max_workers, backend="loky")(
+        delayed(fit_candidate)(spec, X, y, X_val, max(1, cores // max_workers), logging_profile["all_params"])
+        for spec in candidates)
+    wall_seconds = time.time() - start
+
+    summary, curves = evaluate_models(y_val, np.column_stack([proba for *_, proba, _ in fitted]),
+                                      [spec["name"] for spec, *_ in fitted])
+    by_name = summary.set_index("Model")
+    rows, models = [], {}
+    for spec, model, fit_seconds, _, train in fitted:
+        metrics = {k: float(by_name.loc[spec["name"], v]) for k, v in VALIDATION_METRICS.items()}
+        params = {**model.get_params(), **spec["params"]} if logging_profile["all_params"] else spec["params"]
+        run_id = log_run_batch(spec["name"], params, {**metrics, **train, "fit_seconds": fit_seconds})
+        models[spec["name"]] = model
+        rows.append({"name": spec["name"], "estimator": spec["estimator"], **metrics,
+                     "fit_seconds": fit_seconds, "run_id": run_id})
+        print(f"✅ {spec['name']}: val AUC {metrics['val_roc_auc']:.4f}, fit {fit_seconds:.1f}s, run_id {run_id}")
+
+    leaderboard = pd.DataFrame(rows).sort_values("val_roc_auc", ascending=False, ignore_index=True)
+    print(f"🏁 {len(candidates)} candidates in {wall_seconds:.1f}s wall clock "
+          f"({leaderboard['fit_seconds'].sum():.1f}s of fitting)")
+    log_model_artifacts(leaderboard, models, X)
+    return leaderboard, models, (summary, curves)
+
+
+def log_model_artifacts(leaderboard: pd.DataFrame, models: dict, X):
+    """
+    Upload model artifacts and register models after the sweep, as the logging profile asks.
+    Adds model_logged / registered columns to the leaderboard.
+    """
+    winner = leaderboard.loc[0, "name"]
+    leaderboard["registered"] = [logging_profile["register"] == "all" or name == winner or name in REGISTER_ALWAYS
+                                 for name in leaderboard["name"]]
+    leaderboard["model_logged"] = leaderboard["registered"] | (logging_profile["model_artifacts"] == "all")
+    for row in leaderboard[leaderboard["model_logged"]].itertuples():
+        model = models[row.name]
+        _, flavor = ESTIMATORS[row.estimator]
+        with mlflow.start_run(run_id=row.run_id):
+            mlflow.log_dict(feature_spec, "feature_transformer.json") # Bin edges, categories and column order used by this model
+            flavor.log_model(model, "model",
+                             signature=infer_signature(X.head(100), model.predict(X.head(100))),
+                             input_example=X.head(5) if logging_profile["input_example"] else None,
+                             registered_model_name=row.name if row.registered else None)
+        print(f"📦 {row.name}: model {'logged and registered' if row.registered else 'logged'}")
 
 # METADATA ********************
 
@@ -299,29 +596,146 @@ with mlflow.start_run(run_name="rfc2_sm") as run:
 
 # MARKDOWN ********************
 
-# * Train the model using LightGBM
+# ### Hyperparameter search
+# 
+# With `TUNE_HYPERPARAMETERS = True`, a successive-halving search runs for each estimator before training, and its best configuration is added to the candidates (`rfc_tuned_sm`, `lgbm_tuned_sm`):
+# 
+# 1. `SEARCH_TRIALS` random configurations from `SEARCH_SPACES` are trained with `SEARCH_MIN_RESOURCE` trees / boosting rounds, in parallel worker processes.
+# 1. The best `1 / SEARCH_ETA` of them by validation AUC get `SEARCH_ETA` times the budget in the next rung, until `SEARCH_MAX_RESOURCE` is reached.
+# 1. LightGBM trials stop early once the validation AUC on `X_val` stops improving.
+# 
+# The total number of trees trained per estimator is fixed by these settings, so the search finishes in a known compute envelope. Every trial is logged as a nested run under one `search_<estimator>` run.
+
+# CELL ********************
+
+import lightgbm
+import numpy as np
+
+TUNE_HYPERPARAMETERS = False # True => search, then also train the best config of each estimator
+SEARCH_TRIALS = 27 # configurations per estimator in the first rung
+SEARCH_ETA = 3 # keep the best 1/eta of each rung and give them eta x the budget
+SEARCH_MIN_RESOURCE = 25 # trees / boosting rounds in the first rung
+SEARCH_MAX_RESOURCE = 675 # trees / boosting rounds in the last rung
+EARLY_STOPPING_ROUNDS = 20 # LightGBM rounds without validation AUC improvement
+
+SEARCH_SPACES = { # lists are sampled uniformly, ("log", low, high) log-uniformly
+    "RandomForestClassifier": {
+        "max_depth": [4, 6, 8, 10, 12, None],
+        "max_features": [2, 4, 6, 8, "sqrt"],
+        "min_samples_split": [2, 3, 5, 10],
+        "min_samples_leaf": [1, 2, 4],
+    },
+    "LGBMClassifier": {
+        "learning_rate": ("log", 0.01, 0.3),
+        "num_leaves": [15, 31, 63, 127],
+        "max_depth": [-1, 6, 10],
+        "min_child_samples": [10, 20, 50],
+        "colsample_bytree": [0.6, 0.8, 1.0],
+        "reg_lambda": [0.0, 1.0, 5.0],
+    },
+}
+SEARCH_BASE_PARAMS = {
+    "RandomForestClassifier": {"random_state": 1},
+    "LGBMClassifier": {"objective": "binary", "metric": "auc", "random_state": 42, "verbose": -1}, # auc replaces binary_logloss
+}
+
+
+def sample_config(space: dict, rng) -> dict:
+    config = {}
+    for param, values in space.items():
+        if isinstance(values, tuple) and values[0] == "log":
+            config[param] = float(np.exp(rng.uniform(np.log(values[1]), np.log(values[2]))))
+        else:
+            config[param] = values[rng.integers(len(values))]
+    return config
+
+
+def run_trial(estimator_name: str, config: dict, resource: int, X, y, X_val, y_val, n_jobs: int) -> dict:
+    """
+    Train one configuration with `resource` trees / boosting rounds and score it on the validation set.
+    """
+    estimator, _ = ESTIMATORS[estimator_name]
+    model = estimator(**SEARCH_BASE_PARAMS[estimator_name], **config, n_estimators=resource, n_jobs=n_jobs)
+    start = time.time()
+    if estimator is LGBMClassifier:
+        model.fit(X, y, eval_set=[(X_val, y_val)],
+                  callbacks=[lightgbm.early_stopping(EARLY_STOPPING_ROUNDS, first_metric_only=True, verbose=False)])
+        used = model.best_iteration_ or resource
+    else:
+        model.fit(X, y)
+        used = resource
+    return {"config": config, "resource": resource, "n_estimators": used, "seconds": time.time() - start,
+            "val_roc_auc": roc_auc_score(y_val, model.predict_proba(X_val)[:, 1])}
+
+
+def successive_halving(estimator_name: str, X, y, X_val, y_val, trials: int = SEARCH_TRIALS, eta: int = SEARCH_ETA,
+                       min_resource: int = SEARCH_MIN_RESOURCE, max_resource: int = SEARCH_MAX_RESOURCE,
+                       max_workers: int = None):
+    """
+    Successive-halving search for one estimator. Returns (best params, DataFrame of all trials).
+    """
+    rng = np.random.default_rng(SEED)
+    configs = [sample_config(SEARCH_SPACES[estimator_name], rng) for _ in range(trials)]
+    workers = max_workers or os.cpu_count() or 1
+    n_jobs = max(1, (os.cpu_count() or 1) // workers)
+    history, rung, resource = [], 0, min_resource
+    with mlflow.start_run(run_name=f"search_{estimator_name}") as parent:
+        while True:
+            results = Parallel(n_jobs=min(workers, len(configs)), backend="loky")(
+                delayed(run_trial)(estimator_name, c, resource, X, y, X_val, y_val, n_jobs) for c in configs)
+            for i, r in enumerate(results):
+                log_run_batch(f"{estimator_name}_rung{rung}_trial{i}", {**r["config"], "resource": resource, "rung": rung},
+                              {"val_roc_auc": r["val_roc_auc"], "n_estimators_used": r["n_estimators"],
+                               "fit_seconds": r["seconds"]}, parent_run_id=parent.info.run_id)
+                history.append({"rung": rung, **r})
+            results.sort(key=lambda r: r["val_roc_auc"], reverse=True)
+            print(f"🔎 {estimator_name} rung {rung}: {len(configs)} configs x {resource} -> "
+                  f"best val AUC {results[0]['val_roc_auc']:.4f}")
+            if len(configs) == 1 or resource * eta > max_resource:
+                break
+            configs = [r["config"] for r in results[: max(1, len(configs) // eta)]]
+            resource *= eta
+            rung += 1
+
+        best = results[0]
+        best_params = {**SEARCH_BASE_PARAMS[estimator_name], **best["config"], "n_estimators": best["n_estimators"]}
+        mlflow_client.log_batch(parent.info.run_id,
+                                metrics=[Metric("best_val_roc_auc", best["val_roc_auc"], int(time.time() * 1000), 0)],
+                                params=[Param(f"best_{k}", str(v)) for k, v in best_params.items()])
+    return best_params, pd.DataFrame(history)
+
+
+if TUNE_HYPERPARAMETERS:
+    for estimator_name, candidate_name in [("RandomForestClassifier", "rfc_tuned_sm"), ("LGBMClassifier", "lgbm_tuned_sm")]:
+        best_params, trials = successive_halving(estimator_name, X_res, y_res, X_val, y_val)
+        CANDIDATES.append({"name": candidate_name, "estimator": estimator_name, "params": best_params})
+        print(f"✅ {candidate_name}: {best_params}")
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# CELL ********************
+
+leaderboard, models, (evaluation_summary, evaluation_curves) = train_candidates(CANDIDATES, X_res, y_res, X_val, y_val) # Balanced training data
+display(leaderboard)
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
 
 # CELL ********************
 
-# lgbm_model
-mlflow.lightgbm.autolog(registered_model_name='lgbm_sm') # Register the trained model with autologging
-lgbm_sm_model = LGBMClassifier(learning_rate = 0.07, 
-                        max_delta_step = 2, 
-                        n_estimators = 100,
-                        max_depth = 10, 
-                        eval_metric = "logloss", 
-                        objective='binary', 
-                        random_state=42)
-
-with mlflow.start_run(run_name="lgbm_sm") as run:
-    lgbm1_sm_run_id = run.info.run_id # Capture run_id for model prediction later
-    # lgbm_sm_model.fit(X_train,y_train) # Imbalanced training data
-    lgbm_sm_model.fit(X_res, y_res.ravel()) # Balanced training data
-    y_pred = lgbm_sm_model.predict(X_val)
-    accuracy = accuracy_score(y_val, y_pred)
-    cr_lgbm_sm = classification_report(y_val, y_pred)
-    cm_lgbm_sm = confusion_matrix(y_val, y_pred)
-    roc_auc_lgbm_sm = roc_auc_score(y_res, lgbm_sm_model.predict_proba(X_res)[:, 1])
+# Keep the names the evaluation cells below use
+rfc1_sm, rfc2_sm, lgbm_sm_model = models["rfc1_sm"], models["rfc2_sm"], models["lgbm_sm"]
+run_ids = leaderboard.set_index("name")["run_id"]
+rfc1_sm_run_id, rfc2_sm_run_id, lgbm1_sm_run_id = run_ids["rfc1_sm"], run_ids["rfc2_sm"], run_ids["lgbm_sm"]
 
 # METADATA ********************
 
@@ -345,21 +759,12 @@ with mlflow.start_run(run_name="lgbm_sm") as run:
 
 # #### Assess the performances of the trained models on the validation dataset
 # 
-# Once done with machine learning model training, you can assess the performance of trained models in two ways.
-# 
-# - Open the saved experiment from the workspace, load the machine learning models, and then assess the performance of the loaded models on the validation dataset.
+# The candidates were scored on the validation dataset once, during training, and `evaluate_models` computed all their metrics together. The comparison is therefore a single call on the saved probabilities: no model is loaded or used for prediction again. The results are appended to the `model_evaluation` and `model_evaluation_curves` delta tables, so runs can be compared over time.
 
 # CELL ********************
 
-# Define run_uri to fetch the model
-# mlflow client: mlflow.model.url, list model
-load_model_rfc1_sm = mlflow.sklearn.load_model(f"runs:/{rfc1_sm_run_id}/model")
-load_model_rfc2_sm = mlflow.sklearn.load_model(f"runs:/{rfc2_sm_run_id}/model")
-load_model_lgbm1_sm = mlflow.lightgbm.load_model(f"runs:/{lgbm1_sm_run_id}/model")
-# Assess the performance of the loaded model on validation dataset
-ypred_rfc1_sm_v1 = load_model_rfc1_sm.predict(X_val) # Random Forest with max depth of 4 and 4 features
-ypred_rfc2_sm_v1 = load_model_rfc2_sm.predict(X_val) # Random Forest with max depth of 8 and 6 features
-ypred_lgbm1_sm_v1 = load_model_lgbm1_sm.predict(X_val) # LightGBM
+save_evaluation(evaluation_summary, evaluation_curves)
+display(evaluation_summary)
 
 # METADATA ********************
 
@@ -368,15 +773,21 @@ ypred_lgbm1_sm_v1 = load_model_lgbm1_sm.predict(X_val) # LightGBM
 # META   "language_group": "synapse_pyspark"
 # META }
 
-# MARKDOWN ********************
-
-# - Directly assess the performance of the trained machine learning models on the validation dataset.
-
 # CELL ********************
 
-ypred_rfc1_sm_v2 = rfc1_sm.predict(X_val) # Random Forest with max depth of 4 and 4 features
-ypred_rfc2_sm_v2 = rfc2_sm.predict(X_val) # Random Forest with max depth of 8 and 6 features
-ypred_lgbm1_sm_v2 = lgbm_sm_model.predict(X_val) # LightGBM
+import matplotlib.pyplot as plt
+
+fig, (ax_pr, ax_cal) = plt.subplots(1, 2, figsize=(12, 4))
+for model, curve in evaluation_curves.groupby("Model"):
+    sweep = curve[curve["Kind"] == "threshold"]
+    calibration = curve[(curve["Kind"] == "calibration") & (curve["Count"] > 0)]
+    ax_pr.plot(sweep["Recall"], sweep["Precision"], label=model)
+    ax_cal.plot(calibration["MeanPredicted"], calibration["ObservedRate"], marker="o", label=model)
+ax_pr.set(title="Precision / recall", xlabel="Recall", ylabel="Precision")
+ax_cal.plot([0, 1], [0, 1], linestyle="--", color="grey")
+ax_cal.set(title="Calibration", xlabel="Mean predicted probability", ylabel="Observed churn rate")
+ax_pr.legend()
+plt.show()
 
 # METADATA ********************
 
@@ -387,10 +798,6 @@ ypred_lgbm1_sm_v2 = lgbm_sm_model.predict(X_val) # LightGBM
 
 # MARKDOWN ********************
 
-# Depending on user's preference, either approach is fine and should offer identical performances. In this notebook, you'll choose the first approach in order to better demonstrate the MLflow autologging capabilities in Microsoft Fabric.
-
-# MARKDOWN ********************
-
 #  #### Show True/False Positives/Negatives using the Confusion Matrix
 
 # MARKDOWN ********************
@@ -445,7 +852,7 @@ def plot_confusion_matrix(cm, classes,
 
 # CELL ********************
 
-cfm = confusion_matrix(y_val, y_pred=ypred_rfc1_sm_v1)
+cfm = confusion_at(evaluation_summary, "rfc1_sm")
 plot_confusion_matrix(cfm, classes=['Non Churn','Churn'],
                       title='Random Forest with max depth of 4')
 tn, fp, fn, tp = cfm.ravel()
@@ -463,7 +870,7 @@ tn, fp, fn, tp = cfm.ravel()
 
 # CELL ********************
 
-cfm = confusion_matrix(y_val, y_pred=ypred_rfc2_sm_v1)
+cfm = confusion_at(evaluation_summary, "rfc2_sm")
 plot_confusion_matrix(cfm, classes=['Non Churn','Churn'],
                       title='Random Forest with max depth of 8')
 tn, fp, fn, tp = cfm.ravel()
@@ -481,7 +888,7 @@ tn, fp, fn, tp = cfm.ravel()
 
 # CELL ********************
 
-cfm = confusion_matrix(y_val, y_pred=ypred_lgbm1_sm_v1)
+cfm = confusion_at(evaluation_summary, "lgbm_sm")
 plot_confusion_matrix(cfm, classes=['Non Churn','Churn'],
                       title='LightGBM')
 tn, fp, fn, tp = cfm.ravel()
@@ -16,6 +16,10 @@
 # META           "id": "c6ef34a4-097d-4af6-9994-cfb85664adf9"
 # META         }
 # META       ]
+# META     },
+# META     "environment": {
+# META       "environmentId": "85df38f6-61fe-4f3a-a591-e71b0ead81b6",
+# META       "workspaceId": "00000000-0000-0000-0000-000000000000"
 # META     }
 # META   }
 # META }
@@ -43,7 +47,27 @@
 
 # CELL ********************
 
-%pip install scikit-learn==1.6.1
+%run churn-frames
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# CELL ********************
+
+# Only install what the attached churn_env environment doesn't already provide at the pinned version
+# (missing_requirements comes from churn-frames, which runs again later because %pip install restarts Python)
+REQUIRED = {"scikit-learn": "1.6.1"}
+
+missing = missing_requirements(REQUIRED)
+if missing:
+    print(f"📦 Installing {', '.join(missing)}")
+    get_ipython().run_line_magic("pip", f"install -q {' '.join(missing)}")
+else:
+    print("✅ Required libraries already available from the environment")
 
 # METADATA ********************
 
@@ -56,10 +80,22 @@
 
 # ## Load the test data
 # 
-# Load the test data that you saved in Part 3.
+# Load the test data that you saved in Part 3. The model scoring below moves batches of rows from Spark to pandas; `enable_arrow` (from the `churn-frames` notebook) makes those transfers use Arrow with a fixed batch size.
+
+# CELL ********************
+
+%run churn-frames
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
 
 # CELL ********************
 
+enable_arrow()
 df_test = spark.read.format("delta").load("Tables/df_test")
 display(df_test)
 
@@ -169,6 +205,333 @@ display(df_test.withColumn("predictions", my_udf(*[col(f) for f in features])))
 
 # MARKDOWN ********************
 
+# ### PREDICT with the cached model
+# 
+# Each of the three APIs above loads the model on its own. The `churn-scoring` notebook keeps loaded models in an LRU cache keyed by name and version. `cached_predict_udf` loads `lgbm_sm` once on the driver and broadcasts it once; each Spark Python worker deserialises it once and reuses it for every later batch and call in the session.
+
+# CELL ********************
+
+%run churn-scoring
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# CELL ********************
+
+from pyspark.sql import functions as F
+
+cached_udf = cached_predict_udf(model_name, model_version)
+display(df_test.withColumn("predictions", cached_udf(F.struct(*features))))
+print(f"Driver model cache: {model_cache_stats()}")
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
+# `batch_predict_udf` is the iterator-of-batches variant: the model is fetched once per Spark task instead of once per batch, and `arrow_batch_rows` sets how many rows each model call gets. `SCORING_BACKEND` picks the model it scores with: the MLflow `pyfunc` model, or the `compiled` NumPy tree backend (see below).
+
+# CELL ********************
+
+SCORING_BACKEND = "pyfunc"  # "pyfunc" or "compiled"
+
+batch_udf = batch_predict_udf(model_name, model_version, backend=SCORING_BACKEND)
+with arrow_batch_rows(SCORING_BATCH_ROWS):
+    display(df_test.withColumn("predictions", batch_udf(F.struct(*features))))
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
+# ### Compiled tree backend
+# 
+# `lgbm_sm` and the random forests are tree ensembles, so `churn-scoring` can compile them into flat NumPy node arrays (`backend="compiled"`). Before switching `SCORING_BACKEND`, the cell below checks every registered tree model against its original on `df_test` (probabilities within `PARITY_TOLERANCE`, same labels) and, with `RUN_COMPILED_BENCHMARK = True`, times the pyfunc, native and compiled predictions.
+
+# CELL ********************
+
+from mlflow.tracking import MlflowClient
+
+TREE_MODELS = ["lgbm_sm", "rfc1_sm", "rfc2_sm"]
+RUN_COMPILED_BENCHMARK = False
+
+test_features = to_pandas(df_test, "df_test")
+registered = {m: max(int(v.version) for v in MlflowClient().search_model_versions(f"name='{m}'"))
+              for m in TREE_MODELS if MlflowClient().search_model_versions(f"name='{m}'")}
+parity = pd.DataFrame([check_compiled_parity(m, v, test_features) for m, v in registered.items()])
+display(parity)
+
+if RUN_COMPILED_BENCHMARK:
+    compiled_benchmark = pd.concat([benchmark_compiled(m, v, test_features) for m, v in registered.items()])
+    display(compiled_benchmark.pivot_table(index=["Model", "Backend"], columns="Rows", values="RowsPerSec"))
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
+# ### Score new raw data with the saved feature transformer
+# 
+# `df_test` was transformed in Parts 2 and 3. New customers arrive as raw rows (here, the `bronze_churn` table from Part 1), so they go through the `ChurnFeatures` transformer that was logged with the model. It applies the training bin edges, one-hot categories and column order, without re-running the cleanse notebook.
+
+# CELL ********************
+
+%run churn-features
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# CELL ********************
+
+import mlflow
+from mlflow.tracking import MlflowClient
+
+model_run_id = MlflowClient().get_model_version(model_name, str(model_version)).run_id
+churn_features = ChurnFeatures.from_dict(mlflow.artifacts.load_dict(f"runs:/{model_run_id}/{FEATURE_SPEC_ARTIFACT}"))
+
+new_batch = churn_features.transform_spark(spark.read.format("delta").load("Tables/bronze_churn"))
+display(model.transform(new_batch))
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
+# ### Incremental scoring
+# 
+# Rescoring the whole customer base every day costs the same whether one customer changed or all of them did. `score_incrementally` only scores what changed since the last run:
+# 
+# 1. It reads the rows of `bronze_churn` ingested after the watermark of the last run of this model version. Part 1 merges each file into `bronze_churn` and only stamps a new `_IngestedAtUtc` on new or changed customers, so this skips everything else without reading it twice.
+# 1. It keeps the latest row per `CustomerId`, then drops the rows whose input columns hash to the same `RowHash` the same model version already scored (e.g. a change only to `Exited`).
+# 1. It transforms and scores the rest with the cached model, stamping `ModelName`, `ModelVersion` and `ScoredAtUtc`.
+# 1. It merges the results into `churn_predictions` by `CustomerId`, then records the new watermark in `churn_scoring_watermark`.
+# 
+# A new model version has no watermark yet, so its first run scores everyone once.
+
+# CELL ********************
+
+from datetime import datetime, timezone
+from delta.tables import DeltaTable
+from pyspark.sql import Window
+
+SOURCE_TABLE = "bronze_churn"
+PREDICTIONS_TABLE = "churn_predictions"
+WATERMARK_TABLE = "churn_scoring_watermark"
+KEY = "CustomerId"
+HASH_EXCLUDE = {"RowNumber", "Exited", "_SourceFile", "_IngestedAtUtc"}  # columns that don't change a prediction
+
+
+def read_watermark(model_name: str, model_version):
+    path = f"Tables/{WATERMARK_TABLE}"
+    if not DeltaTable.isDeltaTable(spark, path):
+        return None
+    return (spark.read.format("delta").load(path)
+            .filter((F.col("ModelName") == model_name) & (F.col("ModelVersion") == str(model_version)))
+            .agg(F.max("Watermark")).first()[0])
+
+
+def score_incrementally(model_name: str, model_version, features: ChurnFeatures, backend: str = "pyfunc") -> dict:
+    """
+    Score the new or changed source rows with one model version and merge them into the predictions table.
+    """
+    source = spark.read.format("delta").load(f"Tables/{SOURCE_TABLE}")
+    watermark = read_watermark(model_name, model_version)
+    if watermark is not None:
+        source = source.filter(F.col("_IngestedAtUtc") > F.lit(watermark))
+    new_watermark = source.agg(F.max("_IngestedAtUtc")).first()[0]
+    if new_watermark is None:
+        print(f"✅ Nothing ingested since {watermark}")
+        return {"watermark": watermark, "inserted": 0, "updated": 0}
+    latest = Window.partitionBy(KEY).orderBy(F.col("_IngestedAtUtc").desc(), F.col("RowNumber").desc())
+    source = source.withColumn("_n", F.row_number().over(latest)).filter("_n = 1").drop("_n")  # MERGE needs unique keys
+
+    hashed = source.withColumn("RowHash", F.sha2(F.concat_ws("||", *[
+        F.coalesce(F.col(c).cast("string"), F.lit("")) for c in source.columns if c not in HASH_EXCLUDE]), 256))
+    target_path = f"Tables/{PREDICTIONS_TABLE}"
+    target_exists = DeltaTable.isDeltaTable(spark, target_path)
+    if target_exists:
+        already_scored = (spark.read.format("delta").load(target_path)
+                          .filter((F.col("ModelName") == model_name) & (F.col("ModelVersion") == str(model_version)))
+                          .select(KEY, "RowHash"))
+        hashed = hashed.join(already_scored, [KEY, "RowHash"], "left_anti")
+
+    batch = features.transform_spark(hashed, keep=[KEY, "RowHash", "_IngestedAtUtc"])
+    model_inputs = [c for c in features.columns if c != features.TARGET]
+    predict = batch_predict_udf(model_name, model_version, backend)
+    predictions = batch.select(
+        KEY, "RowHash",
+        predict(F.struct(*model_inputs)).alias("predictions"),
+        F.lit(model_name).alias("ModelName"),
+        F.lit(str(model_version)).alias("ModelVersion"),
+        F.col("_IngestedAtUtc").alias("SourceIngestedAtUtc"),
+        F.current_timestamp().alias("ScoredAtUtc"),
+    )
+
+    with arrow_batch_rows(SCORING_BATCH_ROWS):
+        if target_exists:
+            (DeltaTable.forPath(spark, target_path).alias("t")
+             .merge(predictions.alias("s"), f"t.{KEY} = s.{KEY}")
+             .whenMatchedUpdateAll()
+             .whenNotMatchedInsertAll()
+             .execute())
+        else:
+            predictions.write.format("delta").save(target_path)
+    if target_exists:
+        metrics = DeltaTable.forPath(spark, target_path).history(1).first()["operationMetrics"]
+        inserted, updated = int(metrics.get("numTargetRowsInserted", 0)), int(metrics.get("numTargetRowsUpdated", 0))
+    else:
+        inserted, updated = spark.read.format("delta").load(target_path).count(), 0
+
+    (spark.createDataFrame([(model_name, str(model_version), new_watermark, inserted, updated,
+                             datetime.now(timezone.utc).replace(tzinfo=None))],
+                           "ModelName string, ModelVersion string, Watermark timestamp, Inserted long, Updated long, "
+                           "UpdatedAtUtc timestamp")
+     .write.format("delta").mode("append").save(f"Tables/{WATERMARK_TABLE}"))
+    print(f"✅ {model_name} v{model_version}: {inserted} new, {updated} rescored, watermark {watermark} -> {new_watermark}")
+    return {"watermark": new_watermark, "inserted": inserted, "updated": updated}
+
+
+score_incrementally(model_name, model_version, churn_features, backend=SCORING_BACKEND)
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
+# ### Benchmark the scoring paths
+# 
+# Set `RUN_SCORING_BENCHMARK = True` to compare the paths above on synthetic data: `df_test` resampled with replacement to 1x, 10x and 100x the 10,000 rows of the churn dataset. Each path is warmed up once (model load), then timed writing to Spark's `noop` sink, so only reading and scoring are measured. `batch_udf` and `compiled_udf` (the same UDF on the compiled tree backend) run once per size in `BENCHMARK_BATCH_ROWS`.
+# 
+# Memory comes from the Spark monitoring REST API for the jobs of each run: `PeakExecutionMemoryMB` (shuffle/aggregation memory of the stages) and `PeakJvmHeapMB` / `PeakPythonRssMB` (peak executor metrics of the stages). Python RSS is only reported when `spark.executor.processTreeMetrics.enabled` is set. The results are appended to `scoring_benchmark`.
+
+# CELL ********************
+
+import time
+import requests
+
+RUN_SCORING_BENCHMARK = False
+BENCHMARK_BASE_ROWS = 10_000  # rows of the churn dataset
+BENCHMARK_SCALES = [1, 10, 100]
+BENCHMARK_BATCH_ROWS = [1_000, 10_000, 50_000]
+BENCHMARK_TABLE = "scoring_benchmark"
+SEED = 12345
+
+SCORING_PATHS = {
+    "MLFlowTransformer": lambda df: model.transform(df),
+    "SQL PREDICT": lambda df: sqlt.transform(df),
+    "to_udf": lambda df: df.withColumn("predictions", my_udf(*[col(f) for f in features])),
+    "cached_udf": lambda df: df.withColumn("predictions", cached_udf(F.struct(*features))),
+    "batch_udf": lambda df: df.withColumn("predictions", batch_udf(F.struct(*features))),
+    "compiled_udf": lambda df: df.withColumn(
+        "predictions", batch_predict_udf(model_name, model_version, backend="compiled")(F.struct(*features))),
+}
+BATCHED_PATHS = {"batch_udf", "compiled_udf"}  # timed once per size in BENCHMARK_BATCH_ROWS
+
+
+def synthetic_scoring_data(scale: int):
+    rows = BENCHMARK_BASE_ROWS * scale
+    df = df_test.sample(withReplacement=True, fraction=rows / df_test.count(), seed=SEED).cache()
+    return df, df.count()
+
+
+def stage_memory(job_group: str) -> dict:
+    """
+    Peak memory of the stages run under one job group, from the Spark monitoring REST API (NaN if unavailable).
+    """
+    sc = spark.sparkContext
+    peaks = {"PeakExecutionMemoryMB": 0, "PeakJvmHeapMB": 0, "PeakPythonRssMB": 0}
+    try:
+        base = f"{sc.uiWebUrl}/api/v1/applications/{sc.applicationId}"
+        jobs = [j for j in requests.get(f"{base}/jobs", timeout=30).json() if j.get("jobGroup") == job_group]
+        for stage_id in {s for j in jobs for s in j["stageIds"]}:
+            for attempt in requests.get(f"{base}/stages/{stage_id}", timeout=30).json():
+                executor = attempt.get("peakExecutorMetrics") or {}
+                peaks["PeakExecutionMemoryMB"] = max(peaks["PeakExecutionMemoryMB"], attempt.get("peakExecutionMemory", 0) / 2**20)
+                peaks["PeakJvmHeapMB"] = max(peaks["PeakJvmHeapMB"], executor.get("JVMHeapMemory", 0) / 2**20)
+                peaks["PeakPythonRssMB"] = max(peaks["PeakPythonRssMB"], executor.get("ProcessTreePythonRSSMemory", 0) / 2**20)
+    except Exception as e:
+        print(f"⚠️ Executor memory unavailable: {e}")
+        peaks = {k: float("nan") for k in peaks}
+    return peaks
+
+
+def time_scoring(path: str, df, rows: int, scale: int, batch_rows: int) -> dict:
+    job_group = f"scoring-benchmark-{path}-{scale}x-{batch_rows}-{time.time_ns()}"
+    spark.sparkContext.setJobGroup(job_group, f"{path} at {scale}x")
+    try:
+        with arrow_batch_rows(batch_rows):
+            start = time.perf_counter()
+            SCORING_PATHS[path](df).write.format("noop").mode("overwrite").save()
+            seconds = time.perf_counter() - start
+    finally:
+        spark.sparkContext.setLocalProperty("spark.jobGroup.id", None)
+    return {"Path": path, "Scale": scale, "Rows": rows, "BatchRows": batch_rows, "Seconds": seconds,
+            "RowsPerSec": rows / seconds, **stage_memory(job_group)}
+
+
+def run_scoring_benchmark() -> pd.DataFrame:
+    warmup = df_test.limit(1_000)
+    for path in SCORING_PATHS:
+        SCORING_PATHS[path](warmup).write.format("noop").mode("overwrite").save()
+
+    results = []
+    for scale in BENCHMARK_SCALES:
+        df, rows = synthetic_scoring_data(scale)
+        for path in SCORING_PATHS:
+            for batch_rows in (BENCHMARK_BATCH_ROWS if path in BATCHED_PATHS else [SCORING_BATCH_ROWS]):
+                results.append(time_scoring(path, df, rows, scale, batch_rows))
+                r = results[-1]
+                print(f"⏱️ {path:<17} {scale:>3}x batch {batch_rows:>6,}: {r['RowsPerSec']:>12,.0f} rows/s "
+                      f"| heap {r['PeakJvmHeapMB']:.0f} MB | python {r['PeakPythonRssMB']:.0f} MB")
+        df.unpersist()
+    return pd.DataFrame(results)
+
+
+if RUN_SCORING_BENCHMARK:
+    benchmark = run_scoring_benchmark()
+    to_spark(benchmark.assign(RunAtUtc=pd.Timestamp.utcnow().tz_localize(None)), "benchmark") \
+        .write.format("delta").mode("append").save(f"Tables/{BENCHMARK_TABLE}")
+    fastest = benchmark.loc[benchmark.groupby("Scale")["RowsPerSec"].idxmax(), ["Scale", "Path", "BatchRows", "RowsPerSec"]]
+    print(f"🏁 Fastest path per scale:\n{fastest.to_string(index=False)}")
+    display(benchmark.pivot_table(index=["Path", "BatchRows"], columns="Scale", values="RowsPerSec"))
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
 # ## Write model prediction results to the lakehouse
 # 
 # Once you have generated batch predictions, write the model prediction results back to the lakehouse.  
@@ -0,0 +1,143 @@
+# Fabric notebook source
+
+# METADATA ********************
+
+# META {
+# META   "kernel_info": {
+# META     "name": "synapse_pyspark"
+# META   },
+# META   "dependencies": {
+# META     "environment": {
+# META       "environmentId": "85df38f6-61fe-4f3a-a591-e71b0ead81b6",
+# META       "workspaceId": "00000000-0000-0000-0000-000000000000"
+# META     }
+# META   }
+# META }
+
+# MARKDOWN ********************
+
+# # Churn feature transformer
+# 
+# Shared by the churn notebooks through `%run churn-features`. `ChurnFeatures` holds everything the feature engineering of Part 2 learns from the data:
+# 
+# - the quantile bin edges of `NewCreditsScore`, `NewAgeScore`, `NewBalanceScore` and `NewEstSalaryScore`
+# - the one-hot categories of `Geography` and `Gender`
+# - the column order of `df_clean`
+# 
+# It is fitted once in Part 2, saved as JSON, logged next to every model in Part 3 and loaded back in Part 4. Any new batch, pandas or Spark, is then transformed exactly like the training data without re-running the cleanse notebook. Columns listed in `keep` (keys, timestamps) are passed through in front of the features.
+
+# CELL ********************
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+FEATURE_SPEC_PATH = "/lakehouse/default/Files/churn/features/churn_features.json"  # written by Part 2
+FEATURE_SPEC_ARTIFACT = "feature_transformer.json"  # name of the copy logged with each model
+
+
+class ChurnFeatures:
+    """
+    Fitted, serialisable churn feature engineering. Bins are right-closed and labelled 1..n like pd.qcut;
+    values outside the fitted range fall into the first / last bin and unseen categories get all-False dummies.
+    """
+
+    DROP = ["RowNumber", "CustomerId", "Surname"]
+    TARGET = "Exited"
+    BINS = {  # feature -> (source column, number of quantile bins)
+        "NewCreditsScore": ("CreditScore", 6),
+        "NewAgeScore": ("Age", 8),
+        "NewBalanceScore": ("Balance", 5),
+        "NewEstSalaryScore": ("EstimatedSalary", 10),
+    }
+    ONE_HOT = ["Geography", "Gender"]
+
+    def __init__(self, edges: dict, categories: dict, columns: list):
+        self.edges = edges
+        self.categories = categories
+        self.columns = columns
+
+    @classmethod
+    def _output_columns(cls, columns: list, categories: dict) -> list:
+        derived = set(cls.DROP + cls.ONE_HOT + list(cls.BINS)) | {"NewTenure"}
+        base = [c for c in columns if c not in derived and not any(c.startswith(f"{o}_") for o in cls.ONE_HOT)]
+        dummies = [f"{c}_{v}" for c in cls.ONE_HOT for v in categories[c]]
+        return base + ["NewTenure"] + list(cls.BINS) + dummies
+
+    @classmethod
+    def fit_spark(cls, sdf, relative_error: float = 1e-4) -> "ChurnFeatures":
+        """
+        Fit on a cleansed Spark DataFrame: one approxQuantile pass for all binned columns, one pass for the categories.
+        """
+        from pyspark.sql import functions as F
+
+        sources = [source for source, _ in cls.BINS.values()]
+        quantiles = sdf.approxQuantile(sources, [i / 120 for i in range(121)], relative_error)  # 120 = lcm(5, 6, 8, 10)
+        edges = {feature: values[:: 120 // bins] for (feature, (_, bins)), values in zip(cls.BINS.items(), quantiles)}
+        found = sdf.select([F.collect_set(c).alias(c) for c in cls.ONE_HOT]).first()
+        categories = {c: sorted(found[c]) for c in cls.ONE_HOT}
+        return cls(edges, categories, cls._output_columns(sdf.columns, categories))
+
+    @classmethod
+    def fit_pandas(cls, pdf: pd.DataFrame) -> "ChurnFeatures":
+        """
+        Fit on a cleansed pandas DataFrame, with the same (linear) quantiles pd.qcut uses.
+        """
+        edges = {feature: np.quantile(pdf[source], np.linspace(0, 1, bins + 1)).tolist()
+                 for feature, (source, bins) in cls.BINS.items()}
+        categories = {c: sorted(pdf[c].dropna().unique().tolist()) for c in cls.ONE_HOT}
+        return cls(edges, categories, cls._output_columns(list(pdf.columns), categories))
+
+    def _select(self, columns) -> list:
+        return [c for c in self.columns if c != self.TARGET or c in columns]
+
+    def transform_pandas(self, pdf: pd.DataFrame, keep: list = ()) -> pd.DataFrame:
+        derived = {"NewTenure": pdf["Tenure"].to_numpy() / pdf["Age"].to_numpy()}
+        for feature, (source, _) in self.BINS.items():
+            inner = np.asarray(self.edges[feature][1:-1])
+            derived[feature] = np.searchsorted(inner, pdf[source].to_numpy(), side="left").astype("int64") + 1
+        for c in self.ONE_HOT:
+            values = pdf[c].to_numpy()
+            for v in self.categories[c]:
+                derived[f"{c}_{v}"] = values == v
+        # one concat instead of a column insert per feature keeps small (per-request) batches cheap
+        out = pd.concat([pdf.drop(columns=list(derived), errors="ignore"), pd.DataFrame(derived, index=pdf.index)], axis=1)
+        return out[list(keep) + self._select(out.columns)]
+
+    def transform_spark(self, sdf, keep: list = ()):
+        from pyspark.sql import functions as F
+
+        sdf = sdf.withColumn("NewTenure", F.col("Tenure") / F.col("Age"))
+        for feature, (source, _) in self.BINS.items():
+            label = F.lit(1)
+            for edge in self.edges[feature][1:-1]:
+                label = label + F.when(F.col(source) > F.lit(edge), 1).otherwise(0)
+            sdf = sdf.withColumn(feature, label.cast("long"))
+        dummies = [(F.col(c) == F.lit(v)).alias(f"{c}_{v}") for c in self.ONE_HOT for v in self.categories[c]]
+        return sdf.select(*keep, *[c for c in self._select(sdf.columns) if c in sdf.columns], *dummies)
+
+    def to_dict(self) -> dict:
+        return {"edges": self.edges, "categories": self.categories, "columns": self.columns}
+
+    @classmethod
+    def from_dict(cls, spec: dict) -> "ChurnFeatures":
+        return cls(spec["edges"], spec["categories"], spec["columns"])
+
+    def save(self, path: str = FEATURE_SPEC_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path: str = FEATURE_SPEC_PATH) -> "ChurnFeatures":
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
@@ -0,0 +1,158 @@
+# Fabric notebook source
+
+# METADATA ********************
+
+# META {
+# META   "kernel_info": {
+# META     "name": "synapse_pyspark"
+# META   },
+# META   "dependencies": {
+# META     "environment": {
+# META       "environmentId": "85df38f6-61fe-4f3a-a591-e71b0ead81b6",
+# META       "workspaceId": "00000000-0000-0000-0000-000000000000"
+# META     }
+# META   }
+# META }
+
+# MARKDOWN ********************
+
+# # Churn frame helpers
+# 
+# Shared by the churn notebooks through `%run churn-frames`.
+# 
+# ## Library requirements
+# 
+# `missing_requirements` lists the packages of a `{package: pinned version}` mapping that are missing or at another version, as `pip install` arguments. The churn notebooks only `%pip install` those, since the attached `churn_env` environment normally provides all of them.
+
+# CELL ********************
+
+from importlib.metadata import version, PackageNotFoundError
+
+
+def missing_requirements(required: dict) -> list:
+    missing = []
+    for package, pinned in required.items():
+        try:
+            installed = version(package)
+        except PackageNotFoundError:
+            installed = None
+        if installed is None or (pinned and installed != pinned):
+            missing.append(f"{package}=={pinned}" if pinned else package)
+    return missing
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
+# ## Compact pandas frames
+# 
+# `compact_frame` shrinks a pandas DataFrame in place, so larger extracts fit in the notebook driver:
+# 
+# - integer columns are downcast to the smallest integer type that holds them (the 0/1 flags become `int8`)
+# - low-cardinality string columns such as `Geography` and `Gender` become categoricals
+# - `float64` columns can optionally become `float32` (off by default, it rounds `Balance` and `EstimatedSalary`)
+# 
+# It prints the memory before and after, and returns the original dtypes. Frames that are written to Delta or handed to a model are restored to those dtypes with `restore_dtypes`, so table schemas and logged model signatures don't change.
+
+# CELL ********************
+
+import pandas as pd
+
+
+def frame_memory(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True).sum())
+
+
+def compact_frame(df: pd.DataFrame, name: str = "df", max_category_ratio: float = 0.5,
+                  downcast_floats: bool = False) -> dict:
+    """
+    Downcast numerics and categorise strings of a DataFrame in place, column by column. Returns the original dtypes.
+    """
+    original = df.dtypes.to_dict()
+    before = frame_memory(df)
+    for c in df.columns:
+        s = df[c]
+        if pd.api.types.is_bool_dtype(s) or isinstance(s.dtype, pd.CategoricalDtype):
+            continue
+        if pd.api.types.is_integer_dtype(s):
+            df[c] = pd.to_numeric(s, downcast="integer")
+        elif pd.api.types.is_float_dtype(s):
+            if downcast_floats:
+                df[c] = pd.to_numeric(s, downcast="float")
+        elif pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s):
+            if s.nunique() <= max_category_ratio * len(s):
+                df[c] = s.astype("category")
+    after = frame_memory(df)
+    print(f"📦 {name}: {before / 2**20:.2f} MB -> {after / 2**20:.2f} MB "
+          f"({(1 - after / before) * 100 if before else 0:.0f}% smaller)")
+    return original
+
+
+def restore_dtypes(df: pd.DataFrame, dtypes: dict) -> pd.DataFrame:
+    """
+    The frame with the columns compact_frame changed cast back to their original dtypes.
+    """
+    changed = {c: t for c, t in dtypes.items() if c in df.columns and df[c].dtype != t}
+    return df.astype(changed) if changed else df
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
+# ## Spark / pandas interchange
+# 
+# `enable_arrow` makes every `toPandas` / `createDataFrame` of the session use Arrow, in batches of `ARROW_BATCH_ROWS` rows, and turns off the silent fallback to the slow row-by-row conversion, so an unsupported dtype fails loudly instead. Self-destruct mode frees each Arrow batch while it is converted, so `toPandas` doesn't hold the data twice.
+# 
+# `to_pandas` and `to_spark` wrap the conversions and print how long they took. `to_spark` first maps categoricals to their category type, which Arrow can hand to Spark directly; `bool` and numeric columns already convert without copies.
+
+# CELL ********************
+
+import time
+
+ARROW_BATCH_ROWS = 10_000  # rows per Arrow record batch
+
+
+def enable_arrow(batch_rows: int = ARROW_BATCH_ROWS):
+    spark.conf.set("spark.sql.execution.arrow.pyspark.enabled", "true")
+    spark.conf.set("spark.sql.execution.arrow.pyspark.fallback.enabled", "false")
+    spark.conf.set("spark.sql.execution.arrow.maxRecordsPerBatch", str(batch_rows))
+    spark.conf.set("spark.sql.execution.arrow.pyspark.selfDestruct.enabled", "true")
+
+
+def arrow_ready(pdf: pd.DataFrame) -> pd.DataFrame:
+    """
+    The frame with categorical columns cast to their category dtype (only those columns are copied).
+    """
+    categorical = {c: pdf[c].cat.categories.dtype for c in pdf.columns if isinstance(pdf[c].dtype, pd.CategoricalDtype)}
+    return pdf.astype(categorical) if categorical else pdf
+
+
+def to_pandas(sdf, name: str = "df") -> pd.DataFrame:
+    start = time.time()
+    pdf = sdf.toPandas()
+    print(f"⏱️ {name} -> pandas: {len(pdf):,} rows in {time.time() - start:.2f}s")
+    return pdf
+
+
+def to_spark(pdf: pd.DataFrame, name: str = "df", schema=None):
+    start = time.time()
+    sdf = spark.createDataFrame(arrow_ready(pdf), schema=schema)
+    print(f"⏱️ {name} -> spark: {len(pdf):,} rows in {time.time() - start:.2f}s")
+    return sdf
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
@@ -0,0 +1,442 @@
+# Fabric notebook source
+
+# METADATA ********************
+
+# META {
+# META   "kernel_info": {
+# META     "name": "synapse_pyspark"
+# META   },
+# META   "dependencies": {
+# META     "environment": {
+# META       "environmentId": "85df38f6-61fe-4f3a-a591-e71b0ead81b6",
+# META       "workspaceId": "00000000-0000-0000-0000-000000000000"
+# META     }
+# META   }
+# META }
+
+# MARKDOWN ********************
+
+# # Churn scoring helpers
+# 
+# Shared by the churn notebooks through `%run churn-scoring`.
+# 
+# ## Model cache
+# 
+# Every `mlflow.pyfunc.load_model` downloads and deserialises the model again. `ModelCache` keeps loaded models keyed by model name and version, and evicts the least recently used one beyond `MODEL_CACHE_SIZE` models:
+# 
+# - On the driver, `load_model(name, version)` returns the cached model, so repeated scoring calls in a session load it once.
+# - For Spark, `broadcast_model(name, version)` loads the model once on the driver and broadcasts it once per session. Each executor fetches the broadcast once, and each Python worker deserialises it once into its own process-level cache (`executor_model`), so later tasks on the same worker reuse it.
+
+# CELL ********************
+
+import pickle
+import sys
+import threading
+import types
+from collections import OrderedDict
+
+import mlflow
+from pyspark import cloudpickle
+
+MODEL_CACHE_SIZE = 4  # loaded models kept per process
+
+
+class ModelCache:
+    """
+    Thread-safe LRU cache of loaded models keyed by (name, version).
+    """
+
+    def __init__(self, max_models: int = MODEL_CACHE_SIZE):
+        self.max_models = max_models
+        self.models = OrderedDict()
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, name: str, version, loader):
+        key = (name, str(version))
+        with self._lock:
+            if key in self.models:
+                self.models.move_to_end(key)
+                self.hits += 1
+                return self.models[key]
+        model = loader()
+        with self._lock:
+            self.misses += 1
+            self.models[key] = model
+            self.models.move_to_end(key)
+            while len(self.models) > self.max_models:
+                self.models.popitem(last=False)
+        return model
+
+
+def process_model_cache(max_models: int = MODEL_CACHE_SIZE) -> ModelCache:
+    """
+    The cache of the current Python process. It is kept in sys.modules, so it survives the notebook functions being
+    re-pickled for every Spark task and is shared by all tasks a reused Python worker runs.
+    """
+    holder = sys.modules.get("_churn_model_cache")
+    if holder is None:
+        holder = types.ModuleType("_churn_model_cache")
+        holder.cache = ModelCache(max_models)
+        sys.modules["_churn_model_cache"] = holder
+    return holder.cache
+
+
+def load_model(name: str, version, backend: str = "pyfunc"):
+    """
+    The model from the process cache. backend="compiled" returns the CompiledTreeEnsemble of a tree model (see below).
+    """
+    if backend == "compiled":
+        return compiled_model(name, version)
+    return process_model_cache().get(name, version, lambda: mlflow.pyfunc.load_model(f"models:/{name}/{version}"))
+
+
+_broadcasts = {}
+
+
+def broadcast_model(name: str, version, backend: str = "pyfunc"):
+    """
+    Broadcast of the pickled model, created once per (name, version, backend) and session.
+    """
+    key = (name, str(version), backend)
+    if key not in _broadcasts:
+        # cloudpickle, so classes defined in these notebooks (CompiledTreeEnsemble) are shipped by value
+        _broadcasts[key] = spark.sparkContext.broadcast(cloudpickle.dumps(load_model(name, version, backend)))
+    return _broadcasts[key]
+
+
+def executor_model(name: str, version, broadcast, backend: str = "pyfunc"):
+    """
+    The model inside a Spark task: deserialised from the broadcast once per Python worker.
+    """
+    cache_name = name if backend == "pyfunc" else f"{name} [{backend}]"
+    return process_model_cache().get(cache_name, version, lambda: pickle.loads(broadcast.value))
+
+
+def model_cache_stats() -> dict:
+    cache = process_model_cache()
+    return {"models": [f"{n}/{v}" for n, v in cache.models], "hits": cache.hits, "misses": cache.misses}
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# CELL ********************
+
+import numpy as np
+import pandas as pd
+from pyspark.sql import functions as F
+from pyspark.sql.functions import pandas_udf
+
+
+def cached_predict_udf(name: str, version, backend: str = "pyfunc"):
+    """
+    Spark UDF scoring with the cached, broadcast model. Call it on F.struct(*feature_columns).
+    """
+    broadcast = broadcast_model(name, version, backend)
+
+    @pandas_udf("double")
+    def predict(batch: pd.DataFrame) -> pd.Series:
+        model = executor_model(name, version, broadcast, backend)
+        return pd.Series(np.asarray(model.predict(batch), dtype="double"), index=batch.index)
+
+    return predict
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
+# ## Batched scoring
+# 
+# `batch_predict_udf` is an iterator-of-batches `pandas_udf`: each Spark task fetches the model once and then scores every Arrow batch of its partition as one pandas frame. The batch size is the session's `spark.sql.execution.arrow.maxRecordsPerBatch`; run the Spark action inside `with arrow_batch_rows(rows):` to score with a different size. Larger batches mean fewer Python calls and more memory per Python worker.
+
+# CELL ********************
+
+from contextlib import contextmanager
+from typing import Iterator
+
+SCORING_BATCH_ROWS = 10_000  # rows per Arrow batch handed to the model
+
+
+@contextmanager
+def arrow_batch_rows(rows: int = SCORING_BATCH_ROWS):
+    """
+    Run the Spark actions of the block with `rows` rows per Arrow batch, then restore the previous setting.
+    """
+    key = "spark.sql.execution.arrow.maxRecordsPerBatch"
+    previous = spark.conf.get(key, "10000")
+    spark.conf.set(key, str(rows))
+    try:
+        yield
+    finally:
+        spark.conf.set(key, previous)
+
+
+def batch_predict_udf(name: str, version, backend: str = "pyfunc"):
+    """
+    Iterator-of-batches Spark UDF scoring with the cached, broadcast model. Call it on F.struct(*feature_columns).
+    """
+    broadcast = broadcast_model(name, version, backend)
+
+    @pandas_udf("double")
+    def predict(batches: Iterator[pd.DataFrame]) -> Iterator[pd.Series]:
+        model = executor_model(name, version, broadcast, backend)
+        for batch in batches:
+            yield pd.Series(np.asarray(model.predict(batch), dtype="double"), index=batch.index)
+
+    return predict
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
+# ## Compiled tree backend
+# 
+# The churn models are tree ensembles (scikit-learn random forests and LightGBM). `CompiledTreeEnsemble` flattens all their trees into one set of NumPy node arrays (feature, threshold, left and right child, missing-value direction, leaf value). Scoring moves every row down every tree at once, one vectorised step per tree level, so a batch costs `max_depth` array operations instead of the per-row work of the pyfunc wrappers.
+# 
+# It follows the split rules of each library: scikit-learn compares float32 features with `<=` and sends missing values the way `missing_go_to_left` says; LightGBM compares float64 features and applies its `None` / `Zero` / `NaN` missing types. Categorical LightGBM splits are not supported (the churn features are all numeric or one-hot). `predict` returns the same 0/1 labels as the pyfunc model and `predict_proba` the churn probability.
+# 
+# `compiled_model(name, version)` compiles a registered model once per process; pass `backend="compiled"` to `load_model`, `cached_predict_udf` or `batch_predict_udf` to score with it. `check_compiled_parity` compares it with the original model and `benchmark_compiled` times both.
+# 
+# The gain is mostly per-call overhead: the compiled backend is usually faster for random forests and for small batches, while LightGBM's native C++ predictor can stay ahead on large batches. Choose per model from the benchmark.
+
+# CELL ********************
+
+import time
+
+COMPILED_CHUNK_ROWS = 10_000  # rows moved through the trees at once
+PARITY_TOLERANCE = 1e-6  # max absolute probability difference vs the original model
+_ZERO_THRESHOLD = 1e-35  # LightGBM's kZeroThreshold
+_MISSING_NONE, _MISSING_ZERO, _MISSING_NAN = 0, 1, 2
+
+
+class CompiledTreeEnsemble:
+    """
+    A binary tree ensemble as flat node arrays. The two children of a split are stored next to each other, so a row
+    moves to child[node] + (goes right); leaves are their own child with an infinite threshold, so rows stay there.
+    """
+
+    def __init__(self, feature_names, trees, aggregation: str, sigmoid: float = 1.0, dtype=np.float64):
+        self.feature_names = list(feature_names)
+        self.aggregation = aggregation  # "mean" of leaf probabilities (random forest) or "sigmoid" of summed leaf scores (LightGBM)
+        self.sigmoid = sigmoid
+        self.dtype = dtype
+        offsets = np.cumsum([0] + [len(t["feature"]) for t in trees])
+        self.roots = offsets[:-1].astype(np.intp)
+        self.depth = max(t["depth"] for t in trees)
+        self.feature = np.concatenate([t["feature"] for t in trees]).astype(np.intp)
+        self.threshold = np.concatenate([t["threshold"] for t in trees]).astype(np.float64)
+        self.child = np.concatenate([t["child"] + o for t, o in zip(trees, offsets)]).astype(np.intp)
+        self.default_left = np.concatenate([t["default_left"] for t in trees]).astype(bool)
+        self.missing = np.concatenate([t["missing"] for t in trees]).astype(np.int8)
+        self.value = np.concatenate([t["value"] for t in trees]).astype(np.float64)
+        self.zero_missing = bool(np.any(self.missing == _MISSING_ZERO))
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @staticmethod
+    def _tree(feature, threshold, left, right, default_left, missing, value) -> dict:
+        """
+        Renumber one tree breadth-first so siblings are adjacent. left / right are -1 on leaves.
+        """
+        order, child, depth, level, d = [0], {}, 0, [0], 0
+        while level:
+            next_level = []
+            for n in level:
+                if left[n] >= 0:
+                    child[n] = len(order)
+                    order += [left[n], right[n]]
+                    next_level += [left[n], right[n]]
+            depth, level, d = d, next_level, d + 1
+        new_id = {old: new for new, old in enumerate(order)}
+        leaf = np.array([left[n] < 0 for n in order])
+        return {
+            "feature": np.where(leaf, 0, [feature[n] for n in order]),
+            "threshold": np.where(leaf, np.inf, [threshold[n] for n in order]),
+            "child": np.array([new_id[n] if left[n] < 0 else child[n] for n in order]),
+            "default_left": np.array([default_left[n] for n in order], dtype=bool),
+            "missing": np.where(leaf, _MISSING_NONE, [missing[n] for n in order]),
+            "value": np.array([value[n] for n in order], dtype=np.float64),
+            "depth": depth,
+        }
+
+    @classmethod
+    def from_sklearn(cls, model) -> "CompiledTreeEnsemble":
+        """
+        Compile a fitted scikit-learn RandomForestClassifier (or any binary forest of DecisionTreeClassifiers).
+        """
+        positive = list(model.classes_).index(1)
+        trees = []
+        for estimator in model.estimators_:
+            t = estimator.tree_
+            value = t.value[:, 0, :]
+            trees.append(cls._tree(
+                t.feature, t.threshold, t.children_left, t.children_right,
+                getattr(t, "missing_go_to_left", np.zeros(t.node_count, dtype=bool)),
+                np.full(t.node_count, _MISSING_NAN),
+                value[:, positive] / value.sum(axis=1),
+            ))
+        return cls(model.feature_names_in_, trees, "mean", dtype=np.float32)
+
+    @classmethod
+    def from_lightgbm(cls, model) -> "CompiledTreeEnsemble":
+        """
+        Compile a fitted binary LightGBM model (LGBMClassifier or Booster) at its best iteration.
+        """
+        booster = getattr(model, "booster_", model)
+        dump = booster.dump_model()
+        objective = dump.get("objective", "binary sigmoid:1").split()
+        if objective[0] not in ("binary", "cross_entropy"):
+            raise ValueError(f"Only binary LightGBM models can be compiled, got objective {dump.get('objective')}")
+        sigmoid = float(next((o.split(":")[1] for o in objective if o.startswith("sigmoid:")), 1.0))
+        missing_types = {"None": _MISSING_NONE, "Zero": _MISSING_ZERO, "NaN": _MISSING_NAN}
+
+        trees = []
+        for info in dump["tree_info"]:
+            nodes = {"feature": [], "threshold": [], "left": [], "right": [], "default_left": [], "missing": [], "value": []}
+
+            def add(node) -> int:
+                i = len(nodes["feature"])
+                for k in nodes:
+                    nodes[k].append(0)
+                if "split_feature" not in node:
+                    nodes["left"][i] = nodes["right"][i] = -1
+                    nodes["value"][i] = node.get("leaf_value", 0.0)
+                    return i
+                if node["decision_type"] != "<=":
+                    raise NotImplementedError("Categorical LightGBM splits are not supported by the compiled backend")
+                nodes["feature"][i] = node["split_feature"]
+                nodes["threshold"][i] = node["threshold"]
+                nodes["default_left"][i] = node["default_left"]
+                nodes["missing"][i] = missing_types[node["missing_type"]]
+                nodes["left"][i] = add(node["left_child"])
+                nodes["right"][i] = add(node["right_child"])
+                return i
+
+            add(info["tree_structure"])
+            trees.append(cls._tree(**nodes))
+        return cls(booster.feature_name(), trees, "sigmoid", sigmoid=sigmoid)
+
+    @classmethod
+    def from_model(cls, model) -> "CompiledTreeEnsemble":
+        if hasattr(model, "booster_") or type(model).__module__.startswith("lightgbm"):
+            return cls.from_lightgbm(model)
+        if hasattr(model, "estimators_"):
+            return cls.from_sklearn(model)
+        raise TypeError(f"No compiled backend for {type(model).__name__}")
+
+    def _leaf_values(self, X: np.ndarray) -> np.ndarray:
+        has_nan = bool(np.isnan(X).any())
+        cells = X.ravel()
+        row_start = (np.arange(len(X), dtype=np.intp) * X.shape[1])[:, None]
+        node = np.broadcast_to(self.roots, (len(X), self.n_trees)).copy()
+        for _ in range(self.depth):
+            v = cells[row_start + self.feature[node]]
+            go_right = v > self.threshold[node]
+            if has_nan or self.zero_missing:
+                missing = self.missing[node]
+                isnan = np.isnan(v)
+                if self.aggregation == "sigmoid":  # LightGBM reads NaN as 0 unless the split has a NaN missing type
+                    v = np.where(isnan & (missing != _MISSING_NAN), 0.0, v)
+                    go_right = np.where(isnan, v > self.threshold[node], go_right)
+                is_missing = ((missing == _MISSING_NAN) & isnan) | ((missing == _MISSING_ZERO) & (np.abs(v) <= _ZERO_THRESHOLD))
+                go_right = np.where(is_missing, ~self.default_left[node], go_right)
+            node = self.child[node] + go_right
+        return self.value[node]
+
+    def predict_proba(self, X) -> np.ndarray:
+        """
+        Churn probability of each row. X is a DataFrame with the training columns (any order) or an array in that order.
+        """
+        if isinstance(X, pd.DataFrame):
+            X = X[self.feature_names]
+        X = np.ascontiguousarray(X, dtype=self.dtype)
+        scores = np.empty(len(X))
+        for start in range(0, len(X), COMPILED_CHUNK_ROWS):
+            leaves = self._leaf_values(X[start:start + COMPILED_CHUNK_ROWS])
+            scores[start:start + COMPILED_CHUNK_ROWS] = leaves.mean(axis=1) if self.aggregation == "mean" else leaves.sum(axis=1)
+        return scores if self.aggregation == "mean" else 1.0 / (1.0 + np.exp(-self.sigmoid * scores))
+
+    def predict(self, X) -> np.ndarray:
+        return (self.predict_proba(X) > 0.5).astype(np.int64)
+
+
+def native_model(name: str, version):
+    """
+    The registered model loaded with the MLflow flavor it was logged with (LGBMClassifier, RandomForestClassifier).
+    """
+    uri = f"models:/{name}/{version}"
+    flavors = mlflow.models.get_model_info(uri).flavors
+    flavor = next((getattr(mlflow, f) for f in ("lightgbm", "sklearn") if f in flavors), None)
+    if flavor is None:
+        raise TypeError(f"{uri} has no lightgbm or sklearn flavor to compile: {sorted(flavors)}")
+    return flavor.load_model(uri)
+
+
+def compiled_model(name: str, version) -> CompiledTreeEnsemble:
+    return process_model_cache().get(f"{name} [compiled]", version,
+                                     lambda: CompiledTreeEnsemble.from_model(native_model(name, version)))
+
+
+def check_compiled_parity(name: str, version, X: pd.DataFrame, tolerance: float = PARITY_TOLERANCE) -> dict:
+    """
+    Compare the compiled model with the original one on X; raises AssertionError beyond the tolerance.
+    """
+    native = native_model(name, version)
+    expected = native.predict_proba(X[list(compiled_model(name, version).feature_names)])[:, list(native.classes_).index(1)]
+    compiled = compiled_model(name, version)
+    actual = compiled.predict_proba(X)
+    max_diff = float(np.max(np.abs(actual - expected))) if len(X) else 0.0
+    label_mismatches = int(np.sum(((actual > 0.5) != (expected > 0.5)) & (np.abs(expected - 0.5) > tolerance)))
+    assert max_diff <= tolerance, f"{name} v{version}: compiled probabilities differ by up to {max_diff:.2e}"
+    assert label_mismatches == 0, f"{name} v{version}: {label_mismatches} labels differ away from the 0.5 boundary"
+    print(f"✅ {name} v{version}: {compiled.n_trees} trees, depth {compiled.depth}, max |diff| {max_diff:.1e} on {len(X):,} rows")
+    return {"Model": name, "Version": str(version), "Trees": compiled.n_trees, "Depth": compiled.depth,
+            "Rows": len(X), "MaxAbsDiff": max_diff, "LabelMismatches": label_mismatches}
+
+
+def benchmark_compiled(name: str, version, X: pd.DataFrame, row_counts=(1_000, 10_000, 100_000), repeats: int = 3) -> pd.DataFrame:
+    """
+    Rows/sec of the pyfunc, native and compiled predictions of one model on X resampled to each row count.
+    """
+    backends = {
+        "pyfunc": load_model(name, version).predict,
+        "native": native_model(name, version).predict_proba,
+        "compiled": compiled_model(name, version).predict_proba,
+    }
+    results = []
+    for rows in row_counts:
+        batch = X.sample(n=rows, replace=True, random_state=0).reset_index(drop=True)
+        for backend, predict in backends.items():
+            predict(batch.head(100))
+            seconds = min(_timed(predict, batch) for _ in range(repeats))
+            results.append({"Model": name, "Backend": backend, "Rows": rows, "Seconds": seconds, "RowsPerSec": rows / seconds})
+    return pd.DataFrame(results)
+
+
+def _timed(predict, batch) -> float:
+    start = time.perf_counter()
+    predict(batch)
+    return time.perf_counter() - start
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
\ No newline at end of file
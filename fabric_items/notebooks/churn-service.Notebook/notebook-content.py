@@ -0,0 +1,534 @@
+# Fabric notebook source
+
+# METADATA ********************
+
+# META {
+# META   "kernel_info": {
+# META     "name": "synapse_pyspark"
+# META   },
+# META   "dependencies": {
+# META     "lakehouse": {
+# META       "default_lakehouse": "c6ef34a4-097d-4af6-9994-cfb85664adf9",
+# META       "default_lakehouse_name": "Lakehouse",
+# META       "default_lakehouse_workspace_id": "aba5d898-6b6a-4c5b-af11-62bb9163e914",
+# META       "known_lakehouses": [
+# META         {
+# META           "id": "c6ef34a4-097d-4af6-9994-cfb85664adf9"
+# META         }
+# META       ]
+# META     },
+# META     "environment": {
+# META       "environmentId": "85df38f6-61fe-4f3a-a591-e71b0ead81b6",
+# META       "workspaceId": "00000000-0000-0000-0000-000000000000"
+# META     }
+# META   }
+# META }
+
+# MARKDOWN ********************
+
+# # Churn scoring service
+# 
+# Part 4 scores customers in Spark batches. This notebook serves `lgbm_sm` on demand instead, one customer (or a few) per HTTP request, for callers such as the CRM:
+# 
+# 1. `export_service_bundle` copies the registered model, the `ChurnFeatures` transformer logged with it and a few sample customers from MLflow into one folder (`Files/churn/service/<model>/<version>`).
+# 1. `load_service` loads that bundle once: the native LightGBM (or scikit-learn) model and the fitted feature transform.
+# 1. `start_service` serves it over HTTP. Concurrent requests are micro-batched: the first request of a batch waits at most `MAX_BATCH_WAIT_MS` for others, up to `MAX_BATCH_ROWS` rows, and the batch goes through one `predict_proba` call.
+# 1. `latency_report` sends single-customer requests from `LATENCY_CONCURRENCY` clients and reports p50 / p90 / p99 latency and throughput.
+# 
+# Endpoints:
+# 
+# - `POST /score` with one raw customer (the `bronze_churn` columns), a list of them, or `{"customers": [...]}`. Returns `churn_probability` and the 0/1 `prediction` per customer, with `CustomerId` when it was sent.
+# - `GET /health` and `GET /stats` (server-side latency percentiles, batches and mean batch size).
+# 
+# ## Run it locally
+# 
+# The service only needs pandas, mlflow and the model library, not Spark or Fabric. Download the bundle folder (e.g. with OneLake file explorer), then run this notebook file as a script from a clone of the repo; it loads `ChurnFeatures` from the `churn-features` notebook next to it:
+# 
+# ```
+# python fabric_items/notebooks/churn-service.Notebook/notebook-content.py --bundle-dir ./lgbm_sm/1 --port 8080
+# python fabric_items/notebooks/churn-service.Notebook/notebook-content.py --bundle-dir ./lgbm_sm/1 --report
+# python fabric_items/notebooks/churn-service.Notebook/notebook-content.py --self-test
+# ```
+
+# PARAMETERS CELL ********************
+
+SERVICE_MODEL_NAME = "lgbm_sm"
+SERVICE_MODEL_VERSION = 1
+SERVICE_EXPORT_DIR = "/lakehouse/default/Files/churn/service"  # bundles land in <dir>/<model>/<version>
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8080
+MAX_BATCH_ROWS = 64  # rows per model call
+MAX_BATCH_WAIT_MS = 2.0  # how long the first request of a batch waits for others
+SAMPLE_CUSTOMERS = 200  # raw customers exported with the bundle for the latency report
+LATENCY_REQUESTS = 2_000
+LATENCY_CONCURRENCY = 16
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# CELL ********************
+
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.client import HTTPConnection
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+RUNNING_AS_SCRIPT = "__file__" in globals()  # python notebook-content.py, outside Fabric and Jupyter
+
+if not RUNNING_AS_SCRIPT:
+    get_ipython().run_line_magic("run", "churn-features")
+else:  # load the churn-features notebook source that sits next to this one
+    _features_source = Path(__file__).resolve().parents[1] / "churn-features.Notebook" / "notebook-content.py"
+    exec(compile(_features_source.read_text(encoding="utf-8"), str(_features_source), "exec"))
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
+# ## Export the model bundle
+
+# CELL ********************
+
+def export_service_bundle(name: str, version, export_dir: str = SERVICE_EXPORT_DIR, sample: pd.DataFrame = None) -> str:
+    """
+    Copy a registered model and its feature transformer from MLflow into one self-contained folder.
+    """
+    import mlflow
+    from mlflow.tracking import MlflowClient
+
+    bundle = os.path.join(export_dir, name, str(version))
+    shutil.rmtree(bundle, ignore_errors=True)
+    os.makedirs(bundle)
+    run_id = MlflowClient().get_model_version(name, str(version)).run_id
+    model_path = mlflow.artifacts.download_artifacts(f"models:/{name}/{version}", dst_path=os.path.join(bundle, "model"))
+    features_path = mlflow.artifacts.download_artifacts(f"runs:/{run_id}/{FEATURE_SPEC_ARTIFACT}", dst_path=bundle)
+    manifest = {
+        "name": name, "version": str(version), "run_id": run_id,
+        "model": os.path.relpath(model_path, bundle), "features": os.path.relpath(features_path, bundle),
+        "sample": None, "exported_at": datetime.now(timezone.utc).isoformat(),
+    }
+    if sample is not None:
+        sample.to_json(os.path.join(bundle, "sample_customers.json"), orient="records")
+        manifest["sample"] = "sample_customers.json"
+    with open(os.path.join(bundle, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"📦 {name} v{version} exported to {bundle}")
+    return bundle
+
+
+if not RUNNING_AS_SCRIPT:
+    sample = (spark.read.format("delta").load("Tables/bronze_churn")
+              .drop("_SourceFile", "_IngestedAtUtc", ChurnFeatures.TARGET)
+              .limit(SAMPLE_CUSTOMERS).toPandas())
+    bundle_dir = export_service_bundle(SERVICE_MODEL_NAME, SERVICE_MODEL_VERSION, sample=sample)
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
+# ## Scoring service
+
+# CELL ********************
+
+REQUEST_TIMEOUT_S = 10  # longest a request waits for its batch
+LATENCY_WINDOW = 100_000  # request latencies kept for /stats
+
+
+class MicroBatcher:
+    """
+    Runs the customers submitted by concurrent requests through one predict call: up to max_rows customers, waiting
+    at most max_wait_ms after the first request of the batch.
+    """
+
+    def __init__(self, predict, max_rows: int = MAX_BATCH_ROWS, max_wait_ms: float = MAX_BATCH_WAIT_MS):
+        self.predict = predict
+        self.max_rows = max_rows
+        self.max_wait_ms = max_wait_ms
+        self.batches = self.rows = 0
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, customers: list) -> Future:
+        future = Future()
+        self._queue.put((customers, future))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+
+    def _collect(self, first) -> list:
+        pending, rows = [first], len(first[0])
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while rows < self.max_rows:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.perf_counter(), 0))
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            pending.append(item)
+            rows += len(item[0])
+        return pending
+
+    def _run(self):
+        while (first := self._queue.get()) is not None:
+            pending = self._collect(first)
+            try:
+                scores = self.predict([c for customers, _ in pending for c in customers])
+            except Exception:  # score the requests one by one, so only the bad one fails
+                for customers, future in pending:
+                    try:
+                        future.set_result(self.predict(customers))
+                    except Exception as e:
+                        future.set_exception(e)
+                continue
+            start = 0
+            for customers, future in pending:
+                future.set_result(scores[start:start + len(customers)])
+                start += len(customers)
+            self.batches += 1
+            self.rows += start
+
+
+class ChurnScoringService:
+    """
+    A loaded model and feature transform behind a micro-batcher, with request latency statistics. Request threads only
+    validate; the feature transform and the model run once per batch on the batcher thread.
+    """
+
+    def __init__(self, model, features: ChurnFeatures, name: str, version,
+                 max_batch_rows: int = MAX_BATCH_ROWS, max_batch_wait_ms: float = MAX_BATCH_WAIT_MS):
+        self.model = model
+        self.features = features
+        self.name, self.version = name, str(version)
+        names = next((n for n in (getattr(model, "feature_name_", None), getattr(model, "feature_names_in_", None))
+                      if n is not None), [c for c in features.columns if c != features.TARGET])
+        self.feature_names = list(names)  # feature_names_in_ is a NumPy array
+        self.positive = list(model.classes_).index(1)
+        booster = getattr(model, "booster_", None)
+        if booster is not None and self.positive == 1:  # LightGBM: skip the scikit-learn wrapper's per-call validation
+            self._predict_proba = lambda X: booster.predict(X.to_numpy(dtype=np.float64))
+        else:
+            self._predict_proba = lambda X: model.predict_proba(X)[:, self.positive]
+        outputs = set(features.BINS) | {"NewTenure", features.TARGET} | {
+            f"{c}_{v}" for c in features.ONE_HOT for v in features.categories[c]}
+        self.required = list(dict.fromkeys(
+            [c for c in features.columns if c not in outputs] + features.ONE_HOT
+            + [source for source, _ in features.BINS.values()] + ["Tenure", "Age"]))
+        self.batcher = MicroBatcher(self._predict, max_batch_rows, max_batch_wait_ms)
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def _predict(self, customers: list) -> np.ndarray:
+        X = self.features.transform_pandas(pd.DataFrame.from_records(customers))
+        return self._predict_proba(X[self.feature_names])
+
+    def score(self, customers: list) -> list:
+        """
+        Churn probability and 0/1 prediction of raw customers; ValueError when a customer can't be scored.
+        """
+        start = time.perf_counter()
+        if not customers:
+            raise ValueError("No customers to score")
+        for customer in customers:
+            missing = [c for c in self.required if customer.get(c) is None]
+            if missing:
+                raise ValueError(f"Missing values for {missing}")
+        probabilities = self.batcher.submit(customers).result(timeout=REQUEST_TIMEOUT_S)
+        results = []
+        for customer, p in zip(customers, probabilities):
+            result = {"CustomerId": customer["CustomerId"]} if "CustomerId" in customer else {}
+            results.append({**result, "churn_probability": float(p), "prediction": int(p > 0.5)})
+        self.latencies.append((time.perf_counter() - start) * 1000)
+        return results
+
+    def stats(self) -> dict:
+        latencies = np.array(self.latencies) if self.latencies else np.array([np.nan])
+        return {"model": self.name, "version": self.version, "requests": len(self.latencies),
+                "p50_ms": float(np.percentile(latencies, 50)), "p99_ms": float(np.percentile(latencies, 99)),
+                "batches": self.batcher.batches,
+                "mean_batch_rows": self.batcher.rows / self.batcher.batches if self.batcher.batches else 0.0}
+
+
+def load_service(bundle_dir: str, **batching) -> ChurnScoringService:
+    """
+    Load an exported bundle: the model with the MLflow flavor it was logged with, and the feature transformer.
+    """
+    import mlflow
+
+    with open(os.path.join(bundle_dir, "manifest.json")) as f:
+        manifest = json.load(f)
+    model_dir = os.path.join(bundle_dir, manifest["model"])
+    flavors = mlflow.models.Model.load(model_dir).flavors
+    flavor = next((getattr(mlflow, f) for f in ("lightgbm", "sklearn") if f in flavors), None)
+    if flavor is None:
+        raise TypeError(f"{model_dir} has no lightgbm or sklearn flavor: {sorted(flavors)}")
+    service = ChurnScoringService(flavor.load_model(model_dir), ChurnFeatures.load(os.path.join(bundle_dir, manifest["features"])),
+                                  manifest["name"], manifest["version"], **batching)
+    print(f"✅ Loaded {service.name} v{service.version} ({len(service.feature_names)} features) from {bundle_dir}")
+    return service
+
+
+def scoring_handler(service: ChurnScoringService):
+    class ScoringHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, so clients skip a TCP handshake per request
+        disable_nagle_algorithm = True  # headers and body go out as separate writes; don't hold the body back for an ACK
+
+        def _send(self, status: int, body: dict):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, {"status": "ok", "model": service.name, "version": service.version})
+            elif self.path == "/stats":
+                self._send(200, service.stats())
+            else:
+                self._send(404, {"error": f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path != "/score":
+                self._send(404, {"error": f"Unknown path {self.path}"})
+                return
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"null")
+                customers = payload if isinstance(payload, list) else payload.get("customers", [payload])
+                self._send(200, {"model": service.name, "version": service.version, "predictions": service.score(customers)})
+            except (ValueError, AttributeError, KeyError) as e:
+                self._send(400, {"error": str(e)})
+            except Exception as e:
+                self._send(500, {"error": str(e)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return ScoringHandler
+
+
+class ScoringServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # the default of 5 drops connection bursts into a 1s SYN retry
+
+
+def start_service(service: ChurnScoringService, host: str = SERVICE_HOST, port: int = SERVICE_PORT) -> ScoringServer:
+    """
+    Serve in a background thread; stop with server.shutdown().
+    """
+    server = ScoringServer((host, port), scoring_handler(service))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"🚀 Serving {service.name} v{service.version} on http://{host}:{server.server_port}")
+    return server
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
+# ## Latency report
+
+# CELL ********************
+
+def latency_report(host: str, port: int, customers: list, requests: int = LATENCY_REQUESTS,
+                   concurrency: int = LATENCY_CONCURRENCY) -> dict:
+    """
+    Client-side latency of single-customer /score requests sent by `concurrency` keep-alive clients.
+    """
+    local = threading.local()
+    bodies = [json.dumps(c).encode() for c in customers]
+
+    def call(i: int) -> float:
+        if not hasattr(local, "connection"):
+            local.connection = HTTPConnection(host, port, timeout=REQUEST_TIMEOUT_S)
+        start = time.perf_counter()
+        local.connection.request("POST", "/score", body=bodies[i % len(bodies)], headers={"Content-Type": "application/json"})
+        response = local.connection.getresponse()
+        response.read()
+        if response.status != 200:
+            raise RuntimeError(f"/score returned {response.status}")
+        return (time.perf_counter() - start) * 1000
+
+    for i in range(min(len(bodies), 20)):  # warm-up
+        call(i)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = np.array(list(pool.map(call, range(requests))))
+    elapsed = time.perf_counter() - start
+
+    report = {"requests": requests, "concurrency": concurrency, "requests_per_sec": requests / elapsed,
+              **{f"p{q}_ms": float(np.percentile(latencies, q)) for q in (50, 90, 99)}, "max_ms": float(latencies.max())}
+    print(f"🏁 {requests:,} requests x {concurrency} clients: {report['requests_per_sec']:,.0f} req/s | "
+          f"p50 {report['p50_ms']:.2f} ms | p90 {report['p90_ms']:.2f} ms | p99 {report['p99_ms']:.2f} ms | max {report['max_ms']:.2f} ms")
+    return report
+
+
+def sample_customers(bundle_dir: str) -> list:
+    with open(os.path.join(bundle_dir, "manifest.json")) as f:
+        sample = json.load(f)["sample"]
+    if not sample:
+        raise ValueError(f"{bundle_dir} was exported without sample customers")
+    with open(os.path.join(bundle_dir, sample)) as f:
+        return json.load(f)
+
+
+if not RUNNING_AS_SCRIPT:
+    service = load_service(bundle_dir, max_batch_rows=MAX_BATCH_ROWS, max_batch_wait_ms=MAX_BATCH_WAIT_MS)
+    server = start_service(service)
+    report = latency_report(SERVICE_HOST, server.server_port, sample_customers(bundle_dir))
+    print(f"Server side: {service.stats()}")
+    server.shutdown()
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
+# ## Self-test
+# 
+# `self_test` fits a small random forest and a small LightGBM model on synthetic customers, serves each one, and checks that the probabilities returned over HTTP match the model's own `predict_proba`. It needs no bundle, MLflow or Spark (`--self-test` on the command line).
+
+# CELL ********************
+
+def synthetic_customers(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "RowNumber": np.arange(1, rows + 1), "CustomerId": 15_000_000 + np.arange(rows), "Surname": "Test",
+        "CreditScore": rng.integers(350, 851, rows), "Geography": rng.choice(["France", "Germany", "Spain"], rows),
+        "Gender": rng.choice(["Female", "Male"], rows), "Age": rng.integers(18, 93, rows), "Tenure": rng.integers(0, 11, rows),
+        "Balance": np.where(rng.random(rows) < 0.35, 0.0, rng.uniform(1e4, 2.5e5, rows)),
+        "NumOfProducts": rng.integers(1, 5, rows), "HasCrCard": rng.integers(0, 2, rows),
+        "IsActiveMember": rng.integers(0, 2, rows), "EstimatedSalary": rng.uniform(10, 2e5, rows),
+        "Exited": rng.integers(0, 2, rows),
+    })
+
+
+def self_test(rows: int = 2_000, tolerance: float = 1e-9) -> pd.DataFrame:
+    """
+    Serve a scikit-learn and a LightGBM model fitted on synthetic customers and compare their HTTP scores with predict_proba.
+    """
+    from lightgbm import LGBMClassifier
+    from sklearn.ensemble import RandomForestClassifier
+
+    raw = synthetic_customers(rows)
+    features = ChurnFeatures.fit_pandas(raw.drop(columns=ChurnFeatures.DROP))
+    X = features.transform_pandas(raw).drop(columns=features.TARGET)
+    customers = json.loads(raw.drop(columns=features.TARGET).head(100).to_json(orient="records"))
+    results = []
+    for model in (RandomForestClassifier(n_estimators=20, max_depth=6, random_state=0),
+                  LGBMClassifier(n_estimators=50, verbose=-1, random_state=0)):
+        model.fit(X, raw[features.TARGET])
+        service = ChurnScoringService(model, features, type(model).__name__, 0)
+        server = start_service(service, "127.0.0.1", 0)
+        try:
+            connection = HTTPConnection("127.0.0.1", server.server_port, timeout=REQUEST_TIMEOUT_S)
+            connection.request("POST", "/score", body=json.dumps({"customers": customers}),
+                               headers={"Content-Type": "application/json"})
+            response = connection.getresponse()
+            body = json.loads(response.read())
+            assert response.status == 200, f"{type(model).__name__}: /score returned {response.status}: {body}"
+        finally:
+            server.shutdown()
+            service.batcher.close()
+        served = np.array([p["churn_probability"] for p in body["predictions"]])
+        max_diff = float(np.max(np.abs(served - model.predict_proba(X.head(len(customers)))[:, 1])))
+        assert max_diff <= tolerance, f"{type(model).__name__}: served probabilities differ by up to {max_diff:.2e}"
+        assert [p["CustomerId"] for p in body["predictions"]] == [c["CustomerId"] for c in customers]
+        results.append({"Model": type(model).__name__, "Customers": len(customers), "MaxAbsDiff": max_diff})
+    print(f"✅ Self-test passed: {', '.join(r['Model'] for r in results)}")
+    return pd.DataFrame(results)
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
+# ## Command line
+
+# CELL ********************
+
+def main(argv: list = None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve the churn model from an exported bundle.")
+    parser.add_argument("--bundle-dir", help="folder written by export_service_bundle")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--max-batch-rows", type=int, default=MAX_BATCH_ROWS)
+    parser.add_argument("--max-batch-wait-ms", type=float, default=MAX_BATCH_WAIT_MS)
+    parser.add_argument("--report", action="store_true", help="print a latency report against the sample customers and exit")
+    parser.add_argument("--requests", type=int, default=LATENCY_REQUESTS)
+    parser.add_argument("--concurrency", type=int, default=LATENCY_CONCURRENCY)
+    parser.add_argument("--self-test", action="store_true", help="run self_test() and exit; no bundle needed")
+    args = parser.parse_args(argv)
+    if args.self_test:
+        self_test()
+        return
+    if not args.bundle_dir:
+        parser.error("--bundle-dir is required unless --self-test is given")
+
+    service = load_service(args.bundle_dir, max_batch_rows=args.max_batch_rows, max_batch_wait_ms=args.max_batch_wait_ms)
+    server = start_service(service, args.host, args.port)
+    try:
+        if args.report:
+            latency_report(args.host, server.server_port, sample_customers(args.bundle_dir), args.requests, args.concurrency)
+            print(f"Server side: {service.stats()}")
+        else:
+            while True:
+                time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        service.batcher.close()
+
+
+if RUNNING_AS_SCRIPT and __name__ == "__main__":
+    main()
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }